@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cost of .gitignore matching during rtt's directory walk.
+
+Usage:
+    python benchmarks/bench_ignore.py                     # 20k files, 5000 rules
+    python benchmarks/bench_ignore.py --files 50000 --rules 10000
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rtt  # noqa: E402
+
+
+EXTS = [".py", ".js", ".ts", ".log", ".tmp", ".map", ".json", ".md"]
+
+
+def make_tree(root, n_files, seed=0):
+    """Create n_files files across nested directories with mixed extensions."""
+    rng = random.Random(seed)
+    per_dir = 50
+    for i in range(n_files):
+        d = os.path.join(root, f"pkg{i // (per_dir * 40)}", f"mod{(i // per_dir) % 40}")
+        if i % per_dir == 0:
+            os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"file{i}{rng.choice(EXTS)}"), "w") as f:
+            f.write("x\n")
+
+
+def make_rules(n_rules, seed=0):
+    """Generate a realistic mix of literal, suffix, anchored and negated rules."""
+    rng = random.Random(seed)
+    rules = []
+    for i in range(n_rules):
+        kind = rng.random()
+        if kind < 0.4:
+            rules.append(f"generated_{i}")
+        elif kind < 0.6:
+            rules.append(f"*.ext{i}")
+        elif kind < 0.8:
+            rules.append(f"/pkg{rng.randint(100, 999)}/mod{i}/")
+        elif kind < 0.95:
+            rules.append(f"**/cache{i}/**/*.bin")
+        else:
+            rules.append(f"!keep{i}.log")
+    # A few rules that actually prune something
+    rules += ["*.log", "*.tmp", "/pkg1/mod3/", "**/mod7/*.map"]
+    return rules
+
+
+def time_walk(root, ignore, repeat):
+    best = float("inf")
+    n = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        n = sum(1 for _ in rtt.scan_dir(root, ignore=ignore).iter_files())
+        best = min(best, time.perf_counter() - start)
+    return best, n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ignore-rule matching benchmark for rtt.")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--rules", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="rtt-bench-")
+    try:
+        make_tree(root, args.files)
+        rules = make_rules(args.rules)
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write("\n".join(rules) + "\n")
+
+        start = time.perf_counter()
+        rtt.IgnoreRules("", rules)
+        compile_s = time.perf_counter() - start
+
+        plain, n_plain = time_walk(root, False, args.repeat)
+        ignored, n_ignored = time_walk(root, True, args.repeat)
+        print(f"rules compiled:     {len(rules)} in {compile_s * 1000:.1f} ms")
+        print(f"walk, no ignore:    {plain:.3f}s  ({n_plain} files)")
+        print(f"walk, .gitignore:   {ignored:.3f}s  ({n_ignored} files)")
+        match_s = max(ignored - plain - compile_s, 0.0)
+        print(f"matching cost:      {match_s * 1e6 / n_plain:.2f} us/file "
+              f"({(ignored - plain) / plain * 100:+.1f}% over the plain walk, incl. compile)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark serial vs parallel file reading in rtt.merge_files.
+
+Usage:
+    python benchmarks/bench_read.py                   # 50k files, jobs 1/4/8/16
+    python benchmarks/bench_read.py --files 5000 --jobs 1 8
+    python benchmarks/bench_read.py --drop-cache      # approximate a cold cache
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rtt  # noqa: E402
+
+
+def make_tree(root, n_files, seed=0):
+    """Create n_files small source files spread over nested directories."""
+    rng = random.Random(seed)
+    per_dir = 100
+    for i in range(n_files):
+        d = os.path.join(root, f"pkg{i // (per_dir * per_dir)}", f"mod{(i // per_dir) % per_dir}")
+        if i % per_dir == 0:
+            os.makedirs(d, exist_ok=True)
+        body = "".join(f"x_{j} = {rng.random()!r}\n" for j in range(rng.randint(5, 80)))
+        with open(os.path.join(d, f"file{i}.py"), "w") as f:
+            f.write(body)
+
+
+def drop_cache(files):
+    """Ask the kernel to evict the files from the page cache (best effort)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for path in files:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def run(root, files, jobs, cold):
+    if cold:
+        drop_cache(files)
+    start = time.perf_counter()
+    total = 0
+    for chunk in rtt.iter_merge(root, files, jobs):
+        total += len(chunk)
+    return time.perf_counter() - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serial vs parallel read benchmark for rtt.")
+    parser.add_argument("--files", type=int, default=50000, help="Number of files (default: 50000)")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--drop-cache", action="store_true",
+                        help="Evict files from the page cache before each run (Linux)")
+    parser.add_argument("--dir", help="Reuse/create the synthetic tree here instead of a temp dir")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="rtt-bench-")
+    try:
+        if not os.listdir(root):
+            print(f"creating {args.files} files in {root} ...", file=sys.stderr)
+            make_tree(root, args.files)
+        files = list(rtt.collect_files(root, [".py"]))
+
+        print(f"{'jobs':>6} {'best s':>9} {'files/s':>10} {'speedup':>8}")
+        baseline = None
+        for jobs in args.jobs:
+            best = min(run(root, files, jobs, args.drop_cache)[0] for _ in range(args.repeat))
+            baseline = baseline or best
+            print(f"{jobs:>6} {best:>9.3f} {len(files) / best:>10.0f} {baseline / best:>7.2f}x")
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark the rtt pipeline phase by phase on synthetic repos.
+
+Each (shape, size) case runs in a fresh interpreter so peak RSS is its own.
+The phases are timed separately:
+
+    walk    scan_dir over the tree, applying .gitignore rules
+    tree    render_tree of the model
+    read    iter_documents: open, sniff and decode every file, keeping none
+    merge   iter_output into write(): one streamed read+write pass, as the CLI does
+    write   the part of merge spent in write() itself, not waiting on iter_output
+
+Peak RSS is cumulative: the process's high-water mark once a phase ends,
+so it covers the phases before it too.
+
+Usage:
+    python benchmarks/bench_suite.py                          # all shapes, 1k and 10k files
+    python benchmarks/bench_suite.py --shapes wide deep --sizes 1000 50000
+    python benchmarks/bench_suite.py --json results.json      # save the run
+    python benchmarks/bench_suite.py --compare results.json   # speedup vs a saved run
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rtt  # noqa: E402
+import synth  # noqa: E402
+
+
+PHASES = ("walk", "tree", "read", "merge", "write")
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process so far, in KiB (None if unknown)."""
+    # On Linux ru_maxrss survives exec, so it would include the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_case(root, output, cold=False):
+    """Time each phase on one generated repo; return a list of result dicts."""
+    results = []
+
+    def record(phase, start, n_files, nbytes=None, seconds=None):
+        if seconds is None:
+            seconds = time.perf_counter() - start
+        results.append({"phase": phase, "seconds": seconds, "files": n_files,
+                        "files_per_s": n_files / seconds if seconds else None,
+                        "bytes": nbytes, "peak_rss_kb": peak_rss_kb()})
+
+    start = time.perf_counter()
+    model = rtt.scan_dir(root)
+    files = list(model.iter_files())
+    record("walk", start, len(files))
+
+    start = time.perf_counter()
+    tree = rtt.render_tree(model)
+    record("tree", start, len(files))
+
+    if cold:
+        from bench_read import drop_cache
+        drop_cache(f.path for f in files)
+    start = time.perf_counter()
+    nchars = 0
+    for _, content in rtt.iter_documents(root, files):
+        nchars += len(content or "")
+    record("read", start, len(files), nchars)
+
+    if cold:
+        drop_cache(f.path for f in files)
+    producing = 0.0  # time spent inside iter_output, reading and joining
+
+    def timed(chunks):
+        nonlocal producing
+        chunks = iter(chunks)
+        while True:
+            before = time.perf_counter()
+            chunk = next(chunks, None)
+            producing += time.perf_counter() - before
+            if chunk is None:
+                return
+            yield chunk
+
+    start = time.perf_counter()
+    nbytes = rtt.write(timed(rtt.iter_output(root, files, tree)), output)
+    record("merge", start, len(files), nbytes)
+    record("write", None, len(files), nbytes, seconds=results[-1]["seconds"] - producing)
+    os.remove(output)
+    return results
+
+
+def run_isolated(root, output, cold):
+    """Run one case in a child interpreter and return its results."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--run-case", root, output]
+    if cold:
+        cmd.append("--cold")
+    proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(proc.stdout)
+
+
+def _fmt_rate(value):
+    return f"{value:>11.0f}" if value else f"{'-':>11}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phase-by-phase benchmark suite for rtt.")
+    parser.add_argument("--shapes", nargs="+", choices=synth.SHAPES, default=list(synth.SHAPES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000],
+                        help="Files per generated repo (default: 1000 10000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best is kept")
+    parser.add_argument("--cold", action="store_true",
+                        help="Evict files from the page cache before the read phase (Linux)")
+    parser.add_argument("--json", metavar="FILE", help="Save results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="Show speedups against a saved JSON run")
+    parser.add_argument("--dir", help="Generate repos here instead of a temp dir (kept afterwards)")
+    parser.add_argument("--run-case", nargs=2, metavar=("ROOT", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        json.dump(run_case(*args.run_case, cold=args.cold), sys.stdout)
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            for r in json.load(f)["results"]:
+                baseline[(r["shape"], r["size"], r["phase"])] = r["seconds"]
+
+    base = args.dir or tempfile.mkdtemp(prefix="rtt-bench-")
+    results = []
+    header = f"{'shape':<8} {'size':>7} {'phase':<6} {'best s':>9} {'files/s':>11} {'cum. RSS':>10}"
+    print(header + ("  vs baseline" if baseline else ""))
+    try:
+        for shape in args.shapes:
+            for size in args.sizes:
+                root = os.path.join(base, f"{shape}-{size}-{args.seed}")
+                if not os.path.isdir(root):
+                    print(f"generating {shape} repo with {size} files ...", file=sys.stderr)
+                    synth.generate(root, shape, size, args.seed)
+                output = os.path.join(base, f"{shape}-{size}.out.txt")
+                runs = [run_isolated(root, output, args.cold) for _ in range(args.repeat)]
+                for i, phase in enumerate(PHASES):
+                    best = min((run[i] for run in runs), key=lambda r: r["seconds"])
+                    best = dict(best, shape=shape, size=size,
+                                peak_rss_kb=max(run[i]["peak_rss_kb"] or 0 for run in runs) or None)
+                    results.append(best)
+                    rss = f"{best['peak_rss_kb'] / 1024:>7.1f} MB" if best["peak_rss_kb"] else f"{'-':>10}"
+                    line = (f"{shape:<8} {size:>7} {phase:<6} {best['seconds']:>9.4f} "
+                            f"{_fmt_rate(best['files_per_s'])} {rss}")
+                    old = baseline.get((shape, size, phase))
+                    if old:
+                        line += f"  {old / best['seconds']:>6.2f}x"
+                    print(line)
+    finally:
+        if not args.dir:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if args.json:
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "cpus": os.cpu_count(), "seed": args.seed, "repeat": args.repeat,
+                "cold": args.cold, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+        print(f"results saved to {args.json}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic repositories for benchmarking rtt.
+
+The same shape, size and seed always produce byte-identical trees.
+
+Shapes:
+    wide      a few directories holding hundreds of files each
+    deep      long chains of nested directories
+    huge      mostly small files plus a few multi-megabyte ones
+    binary    a third of the files are binary (images, blobs, NUL bytes)
+    ignored   most files sit under .gitignore'd paths
+
+Usage:
+    python benchmarks/synth.py wide 10000 /tmp/repo-wide
+    python benchmarks/synth.py ignored 5000 /tmp/repo-ign --seed 7
+"""
+
+import os
+import sys
+import random
+import argparse
+
+
+SHAPES = ("wide", "deep", "huge", "binary", "ignored")
+SOURCE_EXTS = [".py", ".js", ".swift", ".java", ".md"]
+HUGE_FILE_BYTES = 8 * 1024 * 1024
+WORDS = ("value", "index", "count", "result", "buffer", "config", "node", "item",
+         "total", "path", "name", "data", "state", "cache", "entry", "error")
+
+
+def source_text(rng, lines):
+    """Plausible-looking code: identifiers, numbers, comments and indentation."""
+    out = []
+    for i in range(lines):
+        a, b = rng.choice(WORDS), rng.choice(WORDS)
+        kind = rng.random()
+        if kind < 0.15:
+            out.append(f"# {a} {b} handling for step {i}")
+        elif kind < 0.3:
+            out.append(f"def {a}_{b}_{i}({a}, {b}=None):")
+        else:
+            out.append(f"    {a}_{i} = {b}[{rng.randint(0, 999)}] + {rng.random():.6f}")
+    return "\n".join(out) + "\n"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _small_file(rng, path):
+    _write(path + rng.choice(SOURCE_EXTS), source_text(rng, rng.randint(5, 120)).encode())
+
+
+def generate(root, shape, n_files, seed=0):
+    """Create a synthetic repo of the given shape with about n_files files under root."""
+    if shape not in SHAPES:
+        raise ValueError(f"unknown shape {shape!r} (choose from {', '.join(SHAPES)})")
+    rng = random.Random(f"{shape}:{n_files}:{seed}")
+    os.makedirs(root, exist_ok=True)
+
+    if shape == "wide":
+        per_dir = 500
+        for i in range(n_files):
+            _small_file(rng, os.path.join(root, f"dir{i // per_dir:03d}", f"file{i:06d}"))
+
+    elif shape == "deep":
+        depth = 40
+        for i in range(n_files):
+            chain = i % 25
+            level = (i // 25) % depth
+            parts = [f"chain{chain:02d}"] + [f"level{d:02d}" for d in range(level + 1)]
+            _small_file(rng, os.path.join(root, *parts, f"file{i:06d}"))
+
+    elif shape == "huge":
+        n_huge = max(1, n_files // 1000)
+        for i in range(n_files - n_huge):
+            _small_file(rng, os.path.join(root, f"src{i // 200:03d}", f"file{i:06d}"))
+        chunk = source_text(rng, 2000).encode()
+        for i in range(n_huge):
+            data = chunk * (HUGE_FILE_BYTES // len(chunk) + 1)
+            _write(os.path.join(root, "data", f"huge{i:03d}.py"), data[:HUGE_FILE_BYTES])
+
+    elif shape == "binary":
+        for i in range(n_files):
+            path = os.path.join(root, f"pkg{i // 300:03d}", f"file{i:06d}")
+            kind = i % 3
+            if kind == 0:
+                _small_file(rng, path)
+            elif kind == 1:
+                # Looks like source by name, but has a NUL byte early on
+                body = source_text(rng, rng.randint(5, 60)).encode()
+                _write(path + ".py", body[:64] + b"\0" + body[64:])
+            else:
+                _write(path + rng.choice([".png", ".bin", ".so"]),
+                       bytes(rng.getrandbits(8) for _ in range(rng.randint(256, 16384))))
+
+    elif shape == "ignored":
+        rules = ["build/", "*.log", "/generated/", "node_cache/", "**/tmp/*.py", "!keep.log"]
+        _write(os.path.join(root, ".gitignore"), ("\n".join(rules) + "\n").encode())
+        ignored_dirs = ["build", "generated", "node_cache", os.path.join("lib", "tmp")]
+        for i in range(n_files):
+            if i % 10 < 7:
+                d = os.path.join(root, rng.choice(ignored_dirs), f"mod{i // 400:03d}")
+            else:
+                d = os.path.join(root, "src", f"mod{i // 400:03d}")
+            if i % 17 == 0:
+                _write(os.path.join(d, f"run{i:06d}.log"), b"log line\n" * 50)
+            else:
+                _small_file(rng, os.path.join(d, f"file{i:06d}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic repo for rtt benchmarks.")
+    parser.add_argument("shape", choices=SHAPES)
+    parser.add_argument("files", type=int)
+    parser.add_argument("root")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if os.path.exists(args.root) and os.listdir(args.root):
+        sys.exit(f"synth: {args.root} is not empty")
+    generate(args.root, args.shape, args.files, args.seed)
+
+
+if __name__ == "__main__":
+    main()
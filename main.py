@@ -1,8 +1,259 @@
 import os
+import re
+import bisect
+import queue
 import subprocess
+import threading
+from array import array
+from collections import OrderedDict, deque
+import rtt
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 
+SCAN_BATCH_SIZE = 500   # Entries per message from the scan thread
+INSERT_PER_TICK = 1000  # Tree rows inserted per UI tick, keeps the window responsive
+MODEL_ADDS_PER_TICK = 20000
+SCAN_POLL_MS = 30
+PLACEHOLDER = "..." # Text of the dummy child that makes a folder expandable
+MERGE_BATCH_CHARS = 256 * 1024 # Merged text per message from the merge thread
+PREVIEW_CHARS = 1_000_000 # Shown in the result window; Copy/Export use the full output
+TK_CLIPBOARD_CHARS = 4_000_000 # Largest output copied through Tk when pbcopy/xclip is missing
+FILE_PREVIEW_CHARS = 8192 # Read from the start of a file for the preview pane
+PREVIEW_CACHE_BYTES = 16 * 1024 * 1024
+PREVIEW_DEBOUNCE_MS = 60 # Only the last selection in a burst (e.g. arrow keys) is rendered
+READ_AHEAD = 8 # Following sibling files to preload into the preview cache
+SEARCH_JOBS = 8 # Threads searching file contents for the search box
+
+
+def scan_worker(root_dir, target_exts, out_queue, cancel):
+    """Scan root_dir on a background thread, sending batches of tree entries.
+
+    The walk is rtt's own, so SKIP_DIRS and ignore files prune it like the CLI.
+    Each entry is (parent_path, full_path, name, type_) in top-down order so
+    parents always arrive before their children. A folder is sent with the
+    first file found below it, so empty folders never show. None marks the end.
+    """
+    batch = []
+    sent = {root_dir}
+    
+    def on_dir(node):
+        nonlocal batch
+        if node.files:
+            # Folders on the way down that weren't needed until now
+            missing = []
+            path = node.path
+            while path not in sent:
+                missing.append(path)
+                path = os.path.dirname(path)
+            for path in reversed(missing):
+                batch.append((os.path.dirname(path), path, os.path.basename(path), "folder"))
+                sent.add(path)
+            for f in node.files:
+                batch.append((node.path, f.path, f.name, "file"))
+        if len(batch) >= SCAN_BATCH_SIZE:
+            out_queue.put(batch)
+            batch = []
+        return cancel.is_set()
+    
+    rtt.scan_dir(root_dir, rtt.parse_extensions(target_exts) or None, on_dir=on_dir)
+    if batch:
+        out_queue.put(batch)
+    out_queue.put(None)
+
+
+def merge_worker(root_dir, files, out_queue, cancel):
+    """Merge files on a background thread, sending (files_done, chunks) batches.
+
+    Uses the same engine as the rtt CLI; the output is kept as a list of
+    chunks rather than one growing string. None marks the end.
+    """
+    done = 0
+    
+    def progress(n):
+        nonlocal done
+        done = n
+    
+    batch = []
+    batch_chars = 0
+    for chunk in rtt.iter_chunks(root_dir, files=files, tree=False, progress=progress):
+        if cancel.is_set():
+            break
+        batch.append(chunk)
+        batch_chars += len(chunk)
+        if batch_chars >= MERGE_BATCH_CHARS:
+            out_queue.put((done, batch))
+            batch = []
+            batch_chars = 0
+    
+    out_queue.put((done, batch))
+    out_queue.put(None)
+
+
+def search_worker(grep, nodes, paths, out_queue):
+    """Search file contents on a background thread, then send the ids of the matching nodes."""
+    matched = {entry.path for entry in grep.filter(paths, SEARCH_JOBS)}
+    out_queue.put([node for node, path in zip(nodes, paths) if path in matched])
+
+
+def read_preview(path):
+    """Read the start of a file for the preview pane."""
+    # Read first 8KB for preview to avoid lag on huge files
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        content = f.read(FILE_PREVIEW_CHARS)
+    if len(content) == FILE_PREVIEW_CHARS: content += "\n\n... (preview truncated) ..."
+    return content
+
+
+class PreviewCache:
+    """LRU of file previews keyed by path, bounded by total size.
+
+    Shared between the UI thread, which only calls get(), and the read-ahead
+    thread, which does all the stat and read calls in load().
+    """
+
+    def __init__(self, max_bytes=PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict() # path -> (mtime_ns, preview text)
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Return the cached preview, or None; never touches the disk."""
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            self.entries.move_to_end(path)
+            return entry[1]
+
+    def load(self, path):
+        """Read the preview into the cache unless the cached one is still current."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            self.put(path, None, f"[Error reading file: {e}]")
+            return
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == mtime:
+                return
+        try:
+            content = read_preview(path)
+        except (OSError, ValueError) as e:
+            content = f"[Error reading file: {e}]"
+        self.put(path, mtime, content)
+
+    def put(self, path, mtime, content):
+        with self.lock:
+            old = self.entries.pop(path, None)
+            if old is not None:
+                self.nbytes -= len(old[1])
+            self.entries[path] = (mtime, content)
+            self.nbytes += len(content)
+            while self.nbytes > self.max_bytes:
+                _, (_, old) = self.entries.popitem(last=False)
+                self.nbytes -= len(old)
+
+
+def read_ahead_worker(cache, in_queue, out_queue):
+    """Load previews for paths from in_queue; a whole batch is dropped once a newer one arrives.
+
+    The first path of a batch is the selection; it is sent on out_queue once loaded.
+    """
+    while True:
+        paths = in_queue.get()
+        for i, path in enumerate(paths):
+            if not in_queue.empty():
+                break # The selection moved on
+            cache.load(path)
+            if i == 0:
+                out_queue.put(path)
+
+
+class FileTreeModel:
+    """In-memory project tree; the Treeview only shows rows that were expanded.
+
+    Nodes are integer ids into parallel arrays, node 0 is the project root.
+    Ids are assigned top-down, so a parent always has a smaller id than its children.
+
+    Toggling is O(1): a node records the state it was set to and when
+    (a stamp from a counter). A node's effective state is the one with the
+    newest stamp among itself and its ancestors, so a folder toggle never
+    has to visit the subtree.
+    """
+
+    def __init__(self, root_dir):
+        self.path = [root_dir]
+        self.name = [os.path.basename(root_dir)]
+        self.parent = array("l", [-1])
+        self.children = [[]]
+        self.is_dir = bytearray([1])
+        self.value = bytearray([0]) # State set on the node itself
+        self.stamp = array("Q", [0]) # When value was set; 0 means the default
+        self.clock = 0
+        self.ids = {root_dir: 0} # Folder path -> node id, to attach children
+        self.file_count = 0
+
+    def add(self, parent_path, full_path, name, type_):
+        """Append a node under a known folder; return its id, or None if orphaned."""
+        parent = self.ids.get(parent_path)
+        if parent is None:
+            return None
+        node = len(self.path)
+        is_dir = type_ == "folder"
+        self.path.append(full_path)
+        self.name.append(name)
+        self.parent.append(parent)
+        self.children.append([] if is_dir else None)
+        self.is_dir.append(is_dir)
+        # Folders start unchecked; files are pre-filtered by extension, so they start checked.
+        # A folder toggled before the file arrived still wins, its stamp is newer.
+        self.value.append(not is_dir)
+        self.stamp.append(0)
+        self.children[parent].append(node)
+        if is_dir:
+            self.ids[full_path] = node
+        else:
+            self.file_count += 1
+        return node
+
+    def is_checked(self, node):
+        """Effective state of a node, O(depth)."""
+        stamp, value, parent = self.stamp, self.value, self.parent
+        best, state = stamp[node], value[node]
+        node = parent[node]
+        while node >= 0:
+            if stamp[node] > best:
+                best, state = stamp[node], value[node]
+            node = parent[node]
+        return bool(state)
+
+    def set_checked(self, node, state):
+        """Set a node and, implicitly, everything below it to state."""
+        self.clock += 1
+        self.stamp[node] = self.clock
+        self.value[node] = state
+
+    def checked_files(self):
+        """Paths of all effectively checked files, in scan order, in one pass."""
+        stamp, value, parent, is_dir, path = self.stamp, self.value, self.parent, self.is_dir, self.path
+        if self.clock == 0:
+            return [path[n] for n in range(len(path)) if value[n] and not is_dir[n]]
+        
+        # Parents come first, so each node inherits from an already resolved parent
+        eff_stamp = array("Q", stamp)
+        eff_value = bytearray(value)
+        files = []
+        for n in range(1, len(path)):
+            p = parent[n]
+            if eff_stamp[p] > stamp[n]:
+                eff_stamp[n] = eff_stamp[p]
+                eff_value[n] = eff_value[p]
+            if eff_value[n] and not is_dir[n]:
+                files.append(path[n])
+        return files
+
+
 class CodeMergerApp:
     def __init__(self, root):
         self.root = root
@@ -17,7 +268,22 @@ class CodeMergerApp:
         
         # State variables
         self.selected_dir = ""
-        self.tree_items = {} # Map full path -> tree item id
+        self.model = None # FileTreeModel of the current scan
+        self.node_items = {} # Map node id -> tree item id, only for materialized rows
+        self.item_nodes = {} # Map tree item id -> node id
+        self.loaded = set() # Folder nodes whose children have been inserted
+        self.expanded = set() # Folder nodes currently open in the tree
+        self.scan_cancel = None # threading.Event of the scan in progress
+        self.preview_cache = PreviewCache()
+        self.read_ahead_queue = queue.Queue()
+        self.preview_queue = queue.Queue() # Selected paths the read-ahead thread has loaded
+        self.preview_after = None # Pending debounced preview
+        self.preview_path = None # File shown in the preview pane, until it is loaded
+        self.preview_poll = None # Pending poll_preview
+        self.preview_shown = None # Cached text in the preview pane
+        self.search_queue = None # Result queue of the content search in progress
+        threading.Thread(target=read_ahead_worker, daemon=True,
+                         args=(self.preview_cache, self.read_ahead_queue, self.preview_queue)).start()
 
         # --- Top Section: Controls ---
         control_frame = ttk.Frame(root, padding=10)
@@ -42,6 +308,15 @@ class CodeMergerApp:
         self.entry_ext.pack(side="left", padx=5)
         self.entry_ext.bind("<Return>", lambda event: self.scan_files())
 
+        # 3. Content search: check only the files that match
+        search_frame = ttk.Frame(control_frame)
+        search_frame.pack(side="right", padx=5)
+
+        ttk.Label(search_frame, text="Contains (regex):").pack(side="left", padx=5)
+        self.entry_search = ttk.Entry(search_frame, width=15)
+        self.entry_search.pack(side="left", padx=5)
+        self.entry_search.bind("<Return>", lambda event: self.search_files())
+
         # --- Middle Section: File Tree ---
         # lbl_info = ttk.Label(root, text="Select files/folders to merge (Click to toggle [x]):", font=("Arial", 10, "bold"))
         # lbl_info.pack(anchor="w", padx=10, pady=(5, 0))
@@ -77,6 +352,8 @@ class CodeMergerApp:
         # Bind click event for toggling (existing) and selection for preview (new)
         self.tree.bind("<Button-1>", self.on_tree_click)
         self.tree.bind("<<TreeviewSelect>>", self.on_tree_select)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
+        self.tree.bind("<<TreeviewClose>>", self.on_tree_close)
 
         # Bind click event for toggling
         self.tree.bind("<Button-1>", self.on_tree_click)
@@ -84,6 +361,19 @@ class CodeMergerApp:
         # Heading
         self.tree.heading("#0", text="Project Structure", anchor="w")
         
+        # --- Status bar: scan progress ---
+        status_frame = ttk.Frame(root, padding=(10, 0))
+        status_frame.pack(fill="x")
+        
+        self.progress = ttk.Progressbar(status_frame, mode="indeterminate", length=150)
+        self.progress.pack(side="left", padx=5)
+        
+        self.lbl_status = ttk.Label(status_frame, text="", foreground="gray")
+        self.lbl_status.pack(side="left", padx=5)
+        
+        self.btn_cancel = ttk.Button(status_frame, text="Cancel", command=self.cancel_scan, state="disabled")
+        self.btn_cancel.pack(side="right", padx=5)
+
         # --- Bottom Section: Generate ---
         bottom_frame = ttk.Frame(root, padding=10)
         bottom_frame.pack(fill="x")
@@ -116,120 +406,195 @@ class CodeMergerApp:
 
     def clear_tree(self):
         self.tree.delete(*self.tree.get_children())
-        self.tree_items = {}
+        self.model = None
+        self.node_items = {}
+        self.item_nodes = {}
+        self.loaded = set()
+        self.expanded = set()
+
+    def row_text(self, node):
+        box = "[x]" if self.model.is_checked(node) else "[ ]"
+        icon = "📁" if self.model.is_dir[node] else "📄"
+        return f"{box} {icon} {self.model.name[node]}"
+
+    def insert_row(self, node):
+        """Create the Tk row for a node whose parent row is already loaded."""
+        parent_node = self.model.parent[node]
+        parent_id = "" if parent_node == 0 else self.node_items[parent_node]
+        item_id = self.tree.insert(parent_id, "end", text=self.row_text(node), open=False)
+        self.node_items[node] = item_id
+        self.item_nodes[item_id] = node
+        if self.model.is_dir[node]:
+            # Placeholder child so the folder shows an expand arrow
+            self.tree.insert(item_id, "end", text=PLACEHOLDER)
+        return item_id
+
+    def on_tree_open(self, event):
+        """Insert a folder's children the first time it is expanded, refresh them after."""
+        node = self.item_nodes.get(self.tree.focus())
+        if node is None:
+            return
+        self.expanded.add(node)
+        if node in self.loaded:
+            # Rows hidden under a collapsed folder are not refreshed by toggles
+            self.refresh_rows(node)
+            return
+        item_id = self.node_items[node]
+        self.tree.delete(*self.tree.get_children(item_id))
+        self.loaded.add(node)
+        for child in self.model.children[node]:
+            self.insert_row(child)
+
+    def on_tree_close(self, event):
+        node = self.item_nodes.get(self.tree.focus())
+        self.expanded.discard(node)
+
+    def refresh_rows(self, node):
+        """Redraw the checkboxes of the visible rows below a node."""
+        stack = [node]
+        while stack:
+            for child in self.model.children[stack.pop()]:
+                item = self.node_items.get(child)
+                if item is None: # Its row hasn't been inserted yet
+                    continue
+                self.tree.item(item, text=self.row_text(child))
+                if child in self.expanded:
+                    stack.append(child)
 
     def scan_files(self):
-        """Scan the selected directory and populate the tree view."""
+        """Start scanning the selected directory on a background thread."""
         if not self.selected_dir:
             messagebox.showwarning("Warning", "Please select a folder first!")
             return
         
+        self.cancel_scan()
         self.clear_tree()
+        self.search_queue = None
+        self.model = FileTreeModel(self.selected_dir)
+        self.loaded.add(0) # Top-level rows are inserted as they arrive
+        self.expanded.add(0)
         
         # Get target extensions
         exts_input = self.entry_ext.get()
         target_exts = [e.strip().lower() for e in exts_input.split(',') if e.strip()]
         
-        # Walk through the directory
-        # We want to display the folder structure.
-        # Logic:
-        # 1. We always add directories if they contain relevant files (or we can just show all).
-        #    "Show tree of folders" implies showing structure.
-        #    To keep it clean, maybe we only show folders that match?
-        #    Let's show everything but only 'check' matching files by default?
-        #    Simpler: Show full structure.
+        # The worker only walks; all Tk calls stay on the main thread
+        self.scan_cancel = threading.Event()
+        self.scan_queue = queue.Queue()
+        self.scan_pending = deque()
+        self.scan_rows = deque() # Nodes waiting for a Tk row
+        self.scan_done = False
         
-        # Insert Root Node (invisible or represented by the folder name)
-        # We will insert top-level items directly.
+        worker = threading.Thread(target=scan_worker, daemon=True,
+                                  args=(self.selected_dir, target_exts, self.scan_queue, self.scan_cancel))
+        worker.start()
         
-        # To handle 'os.walk' which is not strictly depth-first in a way that helps us create parents first easily without a map,
-        # we can sort by path length or simply rely on the fact os.walk is top-down.
+        self.progress.start(10)
+        self.btn_cancel.config(state="normal")
+        self.btn_generate.config(state="disabled")
+        self.lbl_status.config(text="Scanning...")
+        self.root.after(SCAN_POLL_MS, self.drain_scan_queue, self.scan_cancel)
+
+    def cancel_scan(self):
+        """Stop the scan in progress, keeping what was already inserted."""
+        if self.scan_cancel is not None and not self.scan_cancel.is_set():
+            self.scan_cancel.set()
+            self.finish_scan(cancelled=True)
+
+    def drain_scan_queue(self, cancel):
+        """Move entries from the scan thread into the tree, a chunk per tick."""
+        if cancel is not self.scan_cancel or cancel.is_set():
+            return # A newer scan started, or this one was cancelled
         
-        # Map: path -> item_id
-        # Root of the tree corresponds to self.selected_dir
+        try:
+            while True:
+                batch = self.scan_queue.get_nowait()
+                if batch is None:
+                    self.scan_done = True
+                else:
+                    self.scan_pending.extend(batch)
+        except queue.Empty:
+            pass
         
-        count_files = 0
+        # Adding to the model is cheap; only children of loaded folders need rows
+        model = self.model
+        for _ in range(min(len(self.scan_pending), MODEL_ADDS_PER_TICK)):
+            node = model.add(*self.scan_pending.popleft())
+            if node is not None and model.parent[node] in self.loaded:
+                self.scan_rows.append(node)
         
-        for root, dirs, files in os.walk(self.selected_dir):
-            # Skip hidden folders like .git
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            # Determine parent item
-            if root == self.selected_dir:
-                parent_id = ""
-            else:
-                parent_id = self.tree_items.get(root)
-                # If for some reason parent doesn't exist (shouldn't happen with walk topdown), skip
-                if parent_id is None:
-                    continue
-            
-            # Add current directory subfolders (We actually add folders as we encounter them in 'dirs' loop? 
-            # No, os.walk structure: 'root' is current path. 'dirs' and 'files' are children.
-            # We iterate children and add them to 'root's tree item.
-            
-            # Wait, 'root' needs to be in the tree first.
-            # If root == selected_dir, its ID is "" (root of treeview).
-            # But Treeview root is generic. We probably want a single top node?
-            # Or just flat list of top-level folders?
-            
-            # 'os.walk' yields root. We need to make sure 'root' has an ID.
-            # EXCEPT for the very first iteration where root == selected_dir.
-            # We don't necessarily need to show the root folder itself as a node, or we can.
-            # Let's just list contents of selected_dir as top-level items.
-            
-            current_dir_id = parent_id # This was set when we processed the *parent* of 'root'.
-            
-            # But wait, os.walk yields the directories in 'dirs'.
-            # We should add the folders in 'dirs' to the tree now, so they exist when os.walk descends into them.
-            
-            for d in dirs:
-                full_path = os.path.join(root, d)
-                rel_path = d # Display name
-                
-                # Checkbox state: defaults to unchecked for folders
-                display_text = f"[ ] 📁 {rel_path}"
-                
-                item_id = self.tree.insert(current_dir_id, "end", text=display_text, open=False, values=(full_path, "folder", "unchecked"))
-                self.tree_items[full_path] = item_id
-
-            for f in files:
-                if f.startswith('.'): continue
-                
-                full_path = os.path.join(root, f)
-                display_name = f
-                
-                # Check if matches extension
-                is_match = False
-                if not target_exts:
-                    is_match = True
-                else:
-                    for ext in target_exts:
-                        if f.lower().endswith(ext):
-                            is_match = True
-                            break
-                            
-                if not is_match:
-                    continue
-                            
-                # Determine initial state (always checked since we filtered)
-                state = "checked"
-                box = "[x]"
-                
-                display_text = f"{box} 📄 {display_name}"
-                
-                item_id = self.tree.insert(current_dir_id, "end", text=display_text, values=(full_path, "file", state))
-                self.tree_items[full_path] = item_id
-                
-                count_files += 1
-
-        # Post-scan: If we wanted to expand folders containing selected files, we could do that.
-        # But for now, keeping them collapsed or auto-expanding top level is fine.
-        # Maybe expand root?
-        # self.tree.item("", open=True) # doesn't apply to root usually in this way.
-        
-        if count_files == 0:
+        for _ in range(min(len(self.scan_rows), INSERT_PER_TICK)):
+            self.insert_row(self.scan_rows.popleft())
+        
+        if self.scan_done and not self.scan_pending and not self.scan_rows:
+            self.finish_scan()
+        else:
+            self.lbl_status.config(text=f"Scanning... {model.file_count:,} files")
+            self.root.after(SCAN_POLL_MS, self.drain_scan_queue, cancel)
+
+    def finish_scan(self, cancelled=False):
+        self.progress.stop()
+        self.btn_cancel.config(state="disabled")
+        self.btn_generate.config(state="normal")
+        
+        if cancelled:
+            self.lbl_status.config(text=f"Scan cancelled ({self.model.file_count:,} files)")
+            return
+        
+        self.scan_cancel = None
+        self.lbl_status.config(text=f"{self.model.file_count:,} files")
+        if self.model.file_count == 0:
             messagebox.showinfo("Scan Info", "No files found matching criteria.")
 
+    def search_files(self):
+        """Check only the files whose content matches the search box; an empty search checks all."""
+        if self.model is None or (self.scan_cancel is not None and not self.scan_cancel.is_set()):
+            messagebox.showwarning("Warning", "Please wait for the scan to finish!")
+            return
+        
+        pattern = self.entry_search.get().strip()
+        if not pattern:
+            self.search_queue = None
+            self.model.set_checked(0, True)
+            self.refresh_rows(0)
+            self.lbl_status.config(text=f"{self.model.file_count:,} files")
+            return
+        try:
+            grep = rtt.Grep(pattern)
+        except re.error as e:
+            messagebox.showerror("Error", f"Invalid search pattern: {e}")
+            return
+        
+        model = self.model
+        nodes = [n for n in range(len(model.path)) if not model.is_dir[n]]
+        self.search_queue = queue.Queue()
+        threading.Thread(target=search_worker, daemon=True,
+                         args=(grep, nodes, [model.path[n] for n in nodes], self.search_queue)).start()
+        
+        self.progress.start(10)
+        self.btn_generate.config(state="disabled")
+        self.lbl_status.config(text="Searching...")
+        self.root.after(SCAN_POLL_MS, self.finish_search, self.search_queue, pattern)
+
+    def finish_search(self, out_queue, pattern):
+        """Apply the search result once the worker is done: matches checked, the rest unchecked."""
+        if out_queue is not self.search_queue:
+            return # A newer search or scan took over
+        try:
+            matched = out_queue.get_nowait()
+        except queue.Empty:
+            self.root.after(SCAN_POLL_MS, self.finish_search, out_queue, pattern)
+            return
+        
+        self.search_queue = None
+        self.progress.stop()
+        self.btn_generate.config(state="normal")
+        self.model.set_checked(0, False)
+        for node in matched:
+            self.model.set_checked(node, True)
+        self.refresh_rows(0)
+        self.lbl_status.config(text=f"{len(matched):,} of {self.model.file_count:,} files contain '{pattern}'")
+
     def on_tree_click(self, event):
         """Handle click events to toggle checkboxes."""
         region = self.tree.identify("region", event.x, event.y)
@@ -239,95 +604,85 @@ class CodeMergerApp:
                 self.toggle_item(item_id)
 
     def toggle_item(self, item_id):
-        """Toggle state of an item and cascade to children."""
-        values = self.tree.item(item_id, "values")
-        if not values: return
-        
-        full_path, type_, current_state = values
-        
-        # Calculate new state
-        new_state = "unchecked" if current_state == "checked" else "checked"
-        new_box = "[x]" if new_state == "checked" else "[ ]"
-        
-        # Update text
-        original_text = self.tree.item(item_id, "text")
-        # Usually text is "[x] 📁 Name". We replace first 3 chars.
-        # But just in case, let's reconstruct it.
-        # Be careful not to lose the icon/name.
-        clean_name = original_text[4:] # assume "[ ] " is 4 chars
-        self.tree.item(item_id, text=f"{new_box} {clean_name}")
-        
-        # Update values
-        self.tree.item(item_id, values=(full_path, type_, new_state))
-        
-        # Cascade if it's a folder
-        if type_ == "folder":
-            self.cascade_toggle(item_id, new_state)
-
-    def cascade_toggle(self, parent_id, new_state):
-        """Recursively toggle all children to match parent state."""
-        children = self.tree.get_children(parent_id)
-        new_box = "[x]" if new_state == "checked" else "[ ]"
-        
-        for child in children:
-            child_values = self.tree.item(child, "values")
-            full_path, type_, _ = child_values
-            
-            # Update child
-            original_text = self.tree.item(child, "text")
-            clean_name = original_text[4:]
-            self.tree.item(child, text=f"{new_box} {clean_name}", values=(full_path, type_, new_state))
-            
-            if type_ == "folder":
-                self.cascade_toggle(child, new_state)
+        """Toggle state of an item; children follow through the model."""
+        node = self.item_nodes.get(item_id)
+        if node is None: return # Placeholder row
+        
+        self.model.set_checked(node, not self.model.is_checked(node))
+        self.tree.item(item_id, text=self.row_text(node))
+        
+        # Only rows the user can see need redrawing
+        if self.model.is_dir[node] and node in self.expanded:
+            self.refresh_rows(node)
 
     def on_tree_select(self, event):
-        """Show file content in preview pane when selected."""
+        """Schedule the preview; rapid selection changes only render the last one."""
+        if self.preview_after is not None:
+            self.root.after_cancel(self.preview_after)
+        self.preview_after = self.root.after(PREVIEW_DEBOUNCE_MS, self.show_preview)
+
+    def show_preview(self):
+        """Show file content in preview pane for the current selection."""
+        self.preview_after = None
         selected_items = self.tree.selection()
         if not selected_items:
             return
             
-        item_id = selected_items[0]
-        values = self.tree.item(item_id, "values")
-        if not values:
+        node = self.item_nodes.get(selected_items[0])
+        if node is None:
             return
             
-        full_path, type_, _ = values
+        full_path = self.model.path[node]
         
         self.preview_text.delete(1.0, tk.END)
         
-        if type_ == 'file':
-            try:
-                # Read first 8KB for preview to avoid lag on huge files
-                with open(full_path, "r", encoding="utf-8", errors="replace") as f:
-                    content = f.read(8192) 
-                    if len(content) == 8192: content += "\n\n... (preview truncated) ..."
-                    self.preview_text.insert(tk.END, content)
-            except Exception as e:
-                self.preview_text.insert(tk.END, f"[Error reading file: {e}]")
+        if not self.model.is_dir[node]:
+            # The disk is only touched on the read-ahead thread: show what the cache
+            # has now and redraw once the file is loaded or found changed
+            self.preview_shown = self.preview_cache.get(full_path)
+            loading = self.preview_shown is None
+            self.preview_text.insert(tk.END, "[Loading...]" if loading else self.preview_shown)
+            self.preview_path = full_path
+            if self.preview_poll is None:
+                self.preview_poll = self.root.after(SCAN_POLL_MS, self.poll_preview)
+            self.read_ahead(node)
         else:
-             self.preview_text.insert(tk.END, f"[Folder: {os.path.basename(full_path)}]")
+            self.preview_path = None
+            self.preview_text.insert(tk.END, f"[Folder: {os.path.basename(full_path)}]")
+
+    def poll_preview(self):
+        """Redraw the preview once the read-ahead thread has loaded the selected file."""
+        self.preview_poll = None
+        if self.preview_path is None:
+            return # A folder was selected since
+        try:
+            while True:
+                path = self.preview_queue.get_nowait()
+                if path != self.preview_path:
+                    continue
+                self.preview_path = None
+                content = self.preview_cache.get(path)
+                if content is not self.preview_shown:
+                    self.preview_shown = content
+                    self.preview_text.delete(1.0, tk.END)
+                    self.preview_text.insert(tk.END, content)
+                return
+        except queue.Empty:
+            pass
+        self.preview_poll = self.root.after(SCAN_POLL_MS, self.poll_preview)
+
+    def read_ahead(self, node):
+        """Queue the file for loading, then the next sibling files, the likely next selections."""
+        siblings = self.model.children[self.model.parent[node]]
+        # Children are appended in id order, folders first, so what follows a file is files
+        i = bisect.bisect_right(siblings, node)
+        self.read_ahead_queue.put([self.model.path[n] for n in [node] + siblings[i:i + READ_AHEAD]])
 
     def get_selected_files(self):
-        """Traverse tree to find all checked files."""
-        selected = []
-        
-        # We need to iterate all items.
-        # Treeview doesn't have a simple "get all" linear method easily, so we walk the dictionary or use recursive.
-        # Dictionary self.tree_items has all paths. We can just check their items.
-        
-        for path, item_id in self.tree_items.items():
-            # Check if item still exists (it should)
-            if not self.tree.exists(item_id): continue
-            
-            values = self.tree.item(item_id, "values")
-            if not values: continue
-            
-            path_val, type_, state = values
-            if type_ == "file" and state == "checked":
-                selected.append(path_val)
-                
-        return selected
+        """Return all checked files, in scan order."""
+        if self.model is None:
+            return []
+        return self.model.checked_files()
 
     def generate_output(self):
         selected_files = self.get_selected_files()
@@ -336,51 +691,113 @@ class CodeMergerApp:
             messagebox.showinfo("Info", "No files selected.")
             return
 
-        output_text = ""
-        for file_path in selected_files:
-            rel_path = os.path.relpath(file_path, self.selected_dir)
-            
-            # Required Format
-            output_text += f"// {rel_path}\n\n"
-            
-            try:
-                with open(file_path, "r", encoding="utf-8", errors='ignore') as f:
-                    output_text += f.read()
-            except Exception as e:
-                output_text += f"Error reading file: {e}"
-            
-            output_text += "\n\n" + ("-"*40) + "\n\n"
+        ResultWindow(self.root, self.selected_dir, selected_files)
 
-        self.show_result_window(output_text)
 
-    def show_result_window(self, content):
-        result_window = tk.Toplevel(self.root)
-        result_window.title("Merged Output")
-        result_window.geometry("800x600")
+class ResultWindow:
+    """Result window that fills in while the merge runs on a background thread."""
+
+    def __init__(self, root, root_dir, files):
+        self.root = root
+        self.n_files = len(files)
+        self.chunks = [] # Full merged output; the Text widget only holds a preview
+        self.total_chars = 0
+        self.preview_chars = 0
+        self.done = False
+        
+        self.window = tk.Toplevel(root)
+        self.window.title("Merged Output")
+        self.window.geometry("800x600")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        self.lbl_status = ttk.Label(self.window, text="Merging...", foreground="gray")
+        self.lbl_status.pack(anchor="w", padx=10, pady=(5, 0))
 
         # Text Area
-        txt_area = scrolledtext.ScrolledText(result_window, wrap=tk.WORD, font=("Consolas", 10))
-        txt_area.pack(expand=True, fill='both')
-        txt_area.insert(tk.END, content)
+        self.txt_area = scrolledtext.ScrolledText(self.window, wrap=tk.WORD, font=("Consolas", 10))
+        self.txt_area.pack(expand=True, fill='both')
 
         # Button Frame for actions
-        btn_frame = ttk.Frame(result_window)
+        btn_frame = ttk.Frame(self.window)
         btn_frame.pack(fill="x", pady=5, padx=10)
 
         # Copy Button
-        btn_copy = ttk.Button(btn_frame, text="Copy to Clipboard", command=lambda: self.copy_to_clipboard(result_window, content))
-        btn_copy.pack(side="left", fill="x", expand=True, padx=(0, 5))
+        self.btn_copy = ttk.Button(btn_frame, text="Copy to Clipboard", command=self.copy_to_clipboard, state="disabled")
+        self.btn_copy.pack(side="left", fill="x", expand=True, padx=(0, 5))
 
         # Export Button
-        btn_export = ttk.Button(btn_frame, text="Export as .txt", command=lambda: self.export_as_txt(content))
-        btn_export.pack(side="right", fill="x", expand=True, padx=(5, 0))
+        self.btn_export = ttk.Button(btn_frame, text="Export as .txt", command=self.export_as_txt, state="disabled")
+        self.btn_export.pack(side="right", fill="x", expand=True, padx=(5, 0))
+
+        self.cancel = threading.Event()
+        self.queue = queue.Queue()
+        worker = threading.Thread(target=merge_worker, daemon=True,
+                                  args=(root_dir, files, self.queue, self.cancel))
+        worker.start()
+        self.root.after(SCAN_POLL_MS, self.drain_queue)
+
+    def drain_queue(self):
+        """Collect merged chunks and extend the preview until it is full."""
+        if self.cancel.is_set():
+            return # Window was closed
+        
+        files_done = 0
+        try:
+            while True:
+                item = self.queue.get_nowait()
+                if item is None:
+                    self.done = True
+                    break
+                files_done, batch = item
+                self.chunks.extend(batch)
+                for chunk in batch:
+                    self.total_chars += len(chunk)
+                    self.add_preview(chunk)
+        except queue.Empty:
+            pass
+        
+        if self.done:
+            self.finish()
+            return
+        if files_done:
+            self.lbl_status.config(text=f"Merging... {files_done:,}/{self.n_files:,} files, {self.size_text()}")
+        self.root.after(SCAN_POLL_MS, self.drain_queue)
 
-    def copy_to_clipboard(self, window, content):
-        window.clipboard_clear()
-        window.clipboard_append(content)
+    def add_preview(self, chunk):
+        room = PREVIEW_CHARS - self.preview_chars
+        if room <= 0:
+            return
+        self.txt_area.insert(tk.END, chunk[:room])
+        self.preview_chars += min(len(chunk), room)
+        if len(chunk) > room:
+            self.txt_area.insert(tk.END, "\n\n... (preview truncated, Copy/Export include the full output) ...")
+
+    def size_text(self):
+        tokens = (self.total_chars + rtt.CHARS_PER_TOKEN - 1) // rtt.CHARS_PER_TOKEN
+        return f"{self.total_chars:,} chars (~{tokens:,} tokens)"
+
+    def finish(self):
+        shown = "" if self.total_chars <= PREVIEW_CHARS else f", showing the first {PREVIEW_CHARS:,}"
+        self.lbl_status.config(text=f"{self.n_files:,} files, {self.size_text()}{shown}")
+        self.btn_copy.config(state="normal")
+        self.btn_export.config(state="normal")
+
+    def close(self):
+        self.cancel.set() # Stops the worker and the drain loop
+        self.window.destroy()
+
+    def copy_to_clipboard(self):
+        # pbcopy/xclip take the chunks as a stream; Tk needs them joined into one string
+        if not rtt._copy_to_clipboard(self.chunks):
+            if self.total_chars > TK_CLIPBOARD_CHARS:
+                messagebox.showerror("Error", "No clipboard tool (pbcopy or xclip) found and the "
+                                     "output is too large for Tk's clipboard. Use Export instead.")
+                return
+            self.window.clipboard_clear()
+            self.window.clipboard_append("".join(self.chunks))
         messagebox.showinfo("Success", "Copied to clipboard!")
 
-    def export_as_txt(self, content):
+    def export_as_txt(self):
         file_path = filedialog.asksaveasfilename(
             defaultextension=".txt",
             filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
@@ -388,8 +805,7 @@ class CodeMergerApp:
         )
         if file_path:
             try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
+                rtt.write(self.chunks, file_path)
                 messagebox.showinfo("Success", f"Saved to {file_path}")
             except Exception as e:
                 messagebox.showerror("Error", f"Could not save file: {e}")
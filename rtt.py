@@ -9,11 +9,47 @@ Usage:
     rtt <path> .py .swift               # Only specific extensions
     rtt <path> .py .swift -o out.txt    # Export to file
     rtt <path> --tree                   # Show file tree only
+    rtt <path> -j 16                    # Read files with 16 threads
+    rtt <path> --cache                  # Serve unchanged files from an on-disk cache
+    rtt <path> --max-file-size 1M       # Skip files larger than 1 MB
+    rtt <path> --no-ignore              # Don't apply .gitignore / .rttignore
+    rtt <path> --git                    # Files tracked in the git index
+    rtt <path> --rev v1.2               # Files as of a revision, from the object store
+    rtt <path> --max-tokens 100000      # Warn if output exceeds ~100k tokens
+    rtt snapshot.tar.gz .py             # Read a .zip / .tar(.gz|.bz2|.xz) without extracting
+    rtt <path> --dedup                  # Reference identical files instead of repeating them
+    rtt <path> --compact                # Trim trailing whitespace and blank-line runs
+    rtt <path> --compact=aggressive     # ... and strip comments and docstrings too
+    rtt <path> --grep 'TODO|FIXME'      # Only files whose content matches a regex
+    rtt <path> --grep load_config -C 3  # ... cut down to 3 lines around each match
+    rtt <path> --format jsonl -o out.jsonl     # One JSON record per file
+    rtt <path> --compress gzip -o out.txt.gz   # Compressed as it is written (or xz)
+    rtt <path> -o out.txt --stats       # Per-phase timings and I/O counters on stderr
+    rtt <path> --profile run.prof       # cProfile dump for python -m pstats
+    rtt <path> --max-tokens 100000 --chunk -o ctx.txt   # ctx.001.txt, ctx.002.txt, ...
+    rtt <path> --watch -o out.txt       # Keep out.txt up to date as files change
+    rtt <path> <path> --out-dir ctx/    # One file per project, merged in parallel
+    rtt --batch repos.txt --out-dir ctx/    # Projects listed in a manifest
 """
 
+import io
+import json
 import os
+import re
 import sys
+import time
+import errno
+import bisect
+import codecs
+import hashlib
+import mmap
+import select
+import struct
+import posixpath
 import argparse
+import threading
+from contextlib import contextmanager, nullcontext
+from collections import Counter, deque
 
 
 SKIP_DIRS = {'.git', '.svn', '.hg', 'node_modules', '__pycache__', '.tox',
@@ -21,80 +57,2401 @@ SKIP_DIRS = {'.git', '.svn', '.hg', 'node_modules', '__pycache__', '.tox',
              '.idea', '.vscode', '.DS_Store', 'dist', 'build', '.next'}
 
 
-def collect_files(root_dir, extensions=None):
-    """Walk directory and collect matching files."""
-    matched = []
-    for dirpath, dirnames, filenames in os.walk(root_dir):
-        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.')]
-        dirnames.sort()
+# Per-directory files with .gitignore-style patterns; later files take precedence
+IGNORE_FILES = ('.gitignore', '.rttignore')
 
-        for f in sorted(filenames):
-            if f.startswith('.'):
+SEPARATOR = "\n\n" + "-" * 40 + "\n\n"
+TREE_SEPARATOR = "\n\n" + "=" * 40 + "\n\n"
+
+DEFAULT_JOBS = 1
+# Upper bound on file bytes read ahead of the writer in parallel mode
+MAX_INFLIGHT_BYTES = 64 * 1024 * 1024
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "rtt")
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Rough characters-per-token ratio of BPE tokenizers on code and English
+CHARS_PER_TOKEN = 4
+
+# Leading bytes inspected to tell binary files from text
+SNIFF_BYTES = 8192
+
+# --stats phases in pipeline order; read, decode, compact and write are summed inside merge
+STATS_PHASES = ("walk", "grep", "tree", "read", "decode", "compact", "write", "merge")
+
+# --compact levels, and the sources whose comments "aggressive" knows how to strip
+COMPACT_LEVELS = ("light", "aggressive")
+PYTHON_EXTS = {'.py', '.pyi', '.pyw'}
+C_FAMILY_EXTS = {'.c', '.h', '.cc', '.cpp', '.cxx', '.hh', '.hpp', '.hxx', '.m', '.mm',
+                 '.cs', '.java', '.kt', '.kts', '.swift', '.js', '.jsx', '.mjs', '.cjs',
+                 '.ts', '.tsx', '.go', '.dart'}
+
+# --format and --compress choices; gzip uses the gzip tool's default level, not the slowest
+OUTPUT_FORMATS = ("text", "jsonl")
+COMPRESSIONS = ("gzip", "xz")
+GZIP_LEVEL = 6
+
+# --grep: files handed to a search thread at a time
+GREP_BATCH_FILES = 64
+
+# --watch: quiet period that ends a burst of changes, and the fallback poll interval
+WATCH_DEBOUNCE = 0.2
+WATCH_POLL_INTERVAL = 1.0
+
+
+class Stats:
+    """Per-phase timings and I/O counters for --stats.
+
+    Collection hooks only run while a Stats is installed with enable_stats(),
+    so a normal run pays one None check per file.
+    """
+
+    def __init__(self):
+        self.phases = {}  # phase -> seconds
+        self.stat_calls = 0
+        self.files_read = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()  # Reads may run on a thread pool
+
+    def count_stat(self, n=1):
+        with self._lock:
+            self.stat_calls += n
+
+    def add(self, phase, seconds, files_read=0, bytes_in=0):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.files_read += files_read
+            self.bytes_in += bytes_in
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def _ordered_phases(self):
+        return sorted(self.phases.items(), key=lambda item: (
+            STATS_PHASES.index(item[0]) if item[0] in STATS_PHASES else len(STATS_PHASES)))
+
+    def as_dict(self):
+        return {"phases": {k: round(v, 6) for k, v in self._ordered_phases()},
+                "stat_calls": self.stat_calls, "files_read": self.files_read,
+                "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "cache_hits": self.cache_hits, "cache_misses": self.cache_misses}
+
+    def report(self):
+        """Return report lines: phase timings, then counters."""
+        lines = [f"{'phase':<8} {'seconds':>9}"]
+        for name, seconds in self._ordered_phases():
+            lines.append(f"{name:<8} {seconds:>9.4f}")
+        lines.append(f"stat calls: {self.stat_calls}, files read: {self.files_read}, "
+                     f"bytes in: {self.bytes_in}, bytes out: {self.bytes_out}, "
+                     f"cache: {self.cache_hits} hits / {self.cache_misses} misses")
+        return lines
+
+
+_stats = None
+
+
+def enable_stats():
+    """Install and return a fresh Stats collector for this process."""
+    global _stats
+    _stats = Stats()
+    return _stats
+
+
+class FileEntry:
+    """A matched file in the directory model.
+
+    Files that don't live on disk (e.g. git blobs) carry a loader returning
+    their bytes and a size instead of a stat result. The size may be a
+    function, called the first time it is needed.
+    """
+
+    __slots__ = ("name", "path", "loader", "_entry", "_stat", "_size")
+
+    def __init__(self, name, path, entry=None, loader=None, size=None):
+        self.name = name
+        self.path = path
+        self.loader = loader
+        self._entry = entry
+        self._stat = None
+        self._size = size
+
+    def stat(self):
+        """Return the file's stat result, reusing the walk's DirEntry cache."""
+        if self._stat is None:
+            if self.loader is not None:
+                raise FileNotFoundError(f"{self.path} is not read from the filesystem")
+            entry = self._entry
+            self._stat = entry.stat() if entry is not None else os.stat(self.path)
+            # A symlink's DirEntry already made this call when the walk asked is_dir()
+            if _stats is not None and not (entry is not None and entry.is_symlink()):
+                _stats.count_stat()
+        return self._stat
+
+    @property
+    def size(self):
+        if callable(self._size):
+            self._size = self._size()
+        if self._size is not None:
+            return self._size
+        try:
+            return self.stat().st_size
+        except OSError:
+            return 0
+
+
+class DirNode:
+    """A directory in the model, holding only subtrees with matched files."""
+
+    __slots__ = ("name", "path", "dirs", "files", "closer")
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.dirs = []
+        self.files = []
+        self.closer = None  # releases what the loaders read from, e.g. an open zip
+
+    def close(self):
+        """Release the model's source; its files can't be loaded afterwards."""
+        if self.closer is not None:
+            self.closer()
+            self.closer = None
+
+    def iter_files(self):
+        """Yield FileEntry objects in output order: own files, then subdirectories."""
+        yield from self.files
+        for d in self.dirs:
+            yield from d.iter_files()
+
+
+def _glob_to_regex(pattern):
+    """Translate a gitignore glob (no leading '!' or trailing '/') to a regex."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            at_segment = (i == 0 or pattern[i - 1] == "/") and pattern.startswith("**", i)
+            if at_segment and i + 2 == n:
+                out.append(".*")
+                i += 2
                 continue
-            if extensions:
-                if not any(f.lower().endswith(ext) for ext in extensions):
-                    continue
-            matched.append(os.path.join(dirpath, f))
-    return matched
+            if at_segment and pattern[i + 2] == "/":
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            out.append("[^/]*")
+            while i + 1 < n and pattern[i + 1] == "*":
+                i += 1
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j < 0:
+                out.append("\\[")
+            else:
+                body = pattern[i + 1:j].replace("\\", "\\\\")
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                out.append(f"(?!/)[{body}]")
+                i = j
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
 
 
-def build_tree(root_dir, extensions=None):
-    """Build a directory tree string for matched files."""
-    lines = [os.path.basename(root_dir) + "/"]
-    matched_files = collect_files(root_dir, extensions)
-    matched_set = set(matched_files)
-
-    # Collect all directories that contain matched files
-    relevant_dirs = set()
-    for fp in matched_files:
-        parent = os.path.dirname(fp)
-        while parent != root_dir and parent.startswith(root_dir):
-            relevant_dirs.add(parent)
-            parent = os.path.dirname(parent)
-
-    def _walk(current_dir, prefix=""):
-        entries = []
-        try:
-            for name in sorted(os.listdir(current_dir)):
-                full = os.path.join(current_dir, name)
-                if os.path.isdir(full):
-                    if name in SKIP_DIRS or name.startswith('.'):
-                        continue
-                    if full in relevant_dirs:
-                        entries.append((name, full, True))
-                elif full in matched_set:
-                    entries.append((name, full, False))
-        except PermissionError:
+def _has_magic(pattern):
+    return any(c in pattern for c in "*?[\\")
+
+
+def _compile_alternatives(items):
+    """Combine (regex, rule) pairs into one fullmatch that reports the last rule.
+
+    Alternatives are ordered by descending rule index, so the first one that
+    matches is the rule git would apply.
+    """
+    items = sorted(items, key=lambda item: item[1][0], reverse=True)
+    fullmatch = re.compile("|".join(f"({regex})" for regex, _ in items), re.DOTALL).fullmatch
+    rules = [rule for _, rule in items]
+
+    def match(path):
+        m = fullmatch(path)
+        return rules[m.lastindex - 1] if m else None
+    return match
+
+
+class _RuleMatcher:
+    """Finds the last matching rule for a path without trying every pattern.
+
+    Rules are (index, negate) pairs. Slash-free globs only ever see the
+    basename, so literal names and '*suffix' globs become dict lookups. Path
+    globs are bucketed by their first literal segment and compiled on first
+    use; '**/'-prefixed ones are tried at every segment of the path.
+    """
+
+    def __init__(self):
+        self.names = {}
+        self.suffixes = {}
+        self.name_globs = []
+        self.anchored = {}
+        self.floating = {}
+        self.other = []
+
+    def add(self, glob, anchored, rule):
+        if not anchored:
+            if not _has_magic(glob):
+                self.names[glob] = rule
+            elif glob.startswith("*") and not _has_magic(glob[1:]):
+                self.suffixes.setdefault(len(glob) - 1, {})[glob[1:]] = rule
+            else:
+                self.name_globs.append((_glob_to_regex(glob), rule))
             return
+        floating = glob.startswith("**/")
+        if floating:
+            glob = glob[3:]
+        first = glob.split("/", 1)[0]
+        if _has_magic(first):
+            prefix = "(?:.*/)?" if floating else ""
+            self.other.append((prefix + _glob_to_regex(glob), rule))
+        else:
+            bucket = self.floating if floating else self.anchored
+            bucket.setdefault(first, []).append((glob, rule))
+
+    def compile(self):
+        self.suffixes = sorted(self.suffixes.items())
+        self.name_globs = _compile_alternatives(self.name_globs) if self.name_globs else None
+        self.other = _compile_alternatives(self.other) if self.other else None
+
+    @staticmethod
+    def _compile_bucket(bucket, key):
+        match = bucket[key] = _compile_alternatives(
+            [(_glob_to_regex(glob), rule) for glob, rule in bucket[key]])
+        return match
 
-        for i, (name, full, is_dir) in enumerate(entries):
+    def match(self, path, name):
+        """Return the highest-index rule matching path, or None."""
+        best = self.names.get(name)
+        for length, table in self.suffixes:
+            rule = table.get(name[-length:] if length else "")
+            if rule is not None and (best is None or rule > best):
+                best = rule
+        candidates = []
+        if self.name_globs is not None:
+            candidates.append(self.name_globs(name))
+        if self.other is not None:
+            candidates.append(self.other(path))
+        if self.anchored or self.floating:
+            segments = path.split("/")
+            match = self.anchored.get(segments[0])
+            if match is not None:
+                if isinstance(match, list):
+                    match = self._compile_bucket(self.anchored, segments[0])
+                candidates.append(match(path))
+            if self.floating:
+                for i, segment in enumerate(segments):
+                    match = self.floating.get(segment)
+                    if match is not None:
+                        if isinstance(match, list):
+                            match = self._compile_bucket(self.floating, segment)
+                        candidates.append(match("/".join(segments[i:])))
+        for rule in candidates:
+            if rule is not None and (best is None or rule > best):
+                best = rule
+        return best
+
+
+class IgnoreRules:
+    """Compiled .gitignore-style rules read from one directory.
+
+    base is the directory's path relative to the walk root ('' for the root),
+    using '/' separators. As in git, the last matching rule wins.
+    """
+
+    def __init__(self, base, lines):
+        self.base = base
+        self._dirs = _RuleMatcher()
+        self._files = _RuleMatcher()
+        self._count = 0
+        for line in lines:
+            if line.endswith("\\ "):
+                line = line.rstrip("\n")
+            else:
+                line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            elif line.startswith(("\\!", "\\#")):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            line = line.lstrip("/")
+            rule = (self._count, negate)
+            self._count += 1
+            self._dirs.add(line, anchored, rule)
+            if not dir_only:
+                self._files.add(line, anchored, rule)
+        self._dirs.compile()
+        self._files.compile()
+
+    def __bool__(self):
+        return self._count > 0
+
+    def match(self, path, name, is_dir):
+        """Return True if ignored, False if re-included by '!', None if no rule applies."""
+        rule = (self._dirs if is_dir else self._files).match(path, name)
+        return None if rule is None else not rule[1]
+
+
+def load_ignore_rules(dir_path, rel_dir, names):
+    """Read the IGNORE_FILES among names in dir_path; return IgnoreRules or None."""
+    lines = []
+    for fname in IGNORE_FILES:
+        if fname in names:
+            try:
+                with open(os.path.join(dir_path, fname), encoding="utf-8", errors="ignore") as f:
+                    lines.extend(f.read().splitlines())
+            except OSError:
+                pass
+    rules = IgnoreRules(rel_dir, lines) if lines else None
+    return rules or None
+
+
+def is_ignored(chain, rel_path, is_dir):
+    """Check rel_path against a chain of IgnoreRules, innermost directory last."""
+    name = rel_path.rpartition("/")[2]
+    for rules in reversed(chain):
+        path = rel_path[len(rules.base) + 1:] if rules.base else rel_path
+        verdict = rules.match(path, name, is_dir)
+        if verdict is not None:
+            return verdict
+    return False
+
+
+def _matches(name, extensions):
+    if name.startswith('.'):
+        return False
+    return not extensions or any(name.lower().endswith(ext) for ext in extensions)
+
+
+def scan_dir(root_dir, extensions=None, ignore=True, visited=None, on_dir=None):
+    """Walk root_dir once with os.scandir and build the directory model.
+
+    With ignore=True, nested .gitignore and .rttignore files prune the walk.
+    Pass a list as visited to collect every directory walked, including
+    those pruned from the model for having no matches. on_dir(node), if
+    given, is called for every directory walked once its own files are
+    listed and before its subdirectories are, so in output order; a true
+    return value stops the walk there, leaving the model partial.
+    """
+    root = DirNode(os.path.basename(root_dir), root_dir)
+    stopped = False
+
+    def _scan(node, rel_dir, chain):
+        nonlocal stopped
+        if visited is not None:
+            visited.append(node.path)
+        try:
+            with os.scandir(node.path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return
+
+        if ignore:
+            rules = load_ignore_rules(node.path, rel_dir, [e.name for e in entries
+                                                           if e.name in IGNORE_FILES])
+            if rules is not None:
+                chain = chain + (rules,)
+
+        subdirs = []
+        for entry in entries:
+            name = entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if _stats is not None and entry.is_symlink():
+                _stats.count_stat()  # is_dir() followed the link; readdir typed the rest
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            if is_dir:
+                # Like os.walk, list symlinked directories but don't descend
+                if name in SKIP_DIRS or name.startswith('.') or entry.is_symlink():
+                    continue
+                if chain and is_ignored(chain, rel_path, True):
+                    continue
+                subdirs.append((DirNode(name, entry.path), rel_path))
+            elif _matches(name, extensions):
+                if chain and is_ignored(chain, rel_path, False):
+                    continue
+                node.files.append(FileEntry(name, entry.path, entry))
+
+        if on_dir is not None and on_dir(node):
+            stopped = True
+        for child, rel_path in subdirs:
+            if stopped:
+                break
+            _scan(child, rel_path, chain)
+            if child.dirs or child.files:
+                node.dirs.append(child)
+
+    _scan(root, "", ())
+    return root
+
+
+def collect_files(root_dir, extensions=None, ignore=True):
+    """Walk directory and yield matching files in output order."""
+    for entry in scan_dir(root_dir, extensions, ignore).iter_files():
+        yield entry.path
+
+
+def render_tree(root):
+    """Render a directory model as a tree string."""
+    lines = [root.name + "/"]
+
+    def _walk(node, prefix=""):
+        entries = sorted(node.dirs + node.files, key=lambda e: e.name)
+        for i, entry in enumerate(entries):
             is_last = i == len(entries) - 1
             connector = "└── " if is_last else "├── "
-            if is_dir:
-                lines.append(f"{prefix}{connector}{name}/")
+            if isinstance(entry, DirNode):
+                lines.append(f"{prefix}{connector}{entry.name}/")
                 extension = "    " if is_last else "│   "
-                _walk(full, prefix + extension)
+                _walk(entry, prefix + extension)
             else:
-                lines.append(f"{prefix}{connector}{name}")
+                lines.append(f"{prefix}{connector}{entry.name}")
 
-    _walk(root_dir)
+    _walk(root)
     return "\n".join(lines)
 
 
-def merge_files(root_dir, files):
+def build_tree(root_dir, extensions=None, ignore=True):
+    """Build a directory tree string for matched files."""
+    return render_tree(scan_dir(root_dir, extensions, ignore))
+
+
+def model_from_paths(root_dir, rel_paths, extensions=None, make_entry=None, read_ignore=None,
+                     ignore_files=(".rttignore",)):
+    """Build the directory model from '/'-separated paths relative to root_dir.
+
+    Applies the same name and extension filters as scan_dir. make_entry(rel_path,
+    name, path) creates each FileEntry; read_ignore(rel_path), if given, returns
+    the text of a listed ignore file (one of ignore_files) so its rules apply
+    as in a walk.
+    """
+    rel_paths = list(rel_paths)
+    make_entry = make_entry or (lambda rel_path, name, path: FileEntry(name, path))
+    root = DirNode(os.path.basename(root_dir), root_dir)
+    nodes = {"": root}
+    chains = {}
+    ignore_dirs = {}  # rel_dir -> ignore file names present there
+    if read_ignore is not None:
+        for rel_path in rel_paths:
+            rel_dir, _, name = rel_path.rpartition("/")
+            if name in ignore_files:
+                ignore_dirs.setdefault(rel_dir, set()).add(name)
+
+    def _chain(rel_dir):
+        if rel_dir not in chains:
+            chain = _chain(rel_dir.rpartition("/")[0]) if rel_dir else ()
+            lines = []
+            for name in ignore_files:
+                if name in ignore_dirs.get(rel_dir, ()):
+                    try:
+                        lines.extend(read_ignore(f"{rel_dir}/{name}" if rel_dir else name)
+                                     .splitlines())
+                    except (OSError, KeyError):
+                        pass
+            rules = IgnoreRules(rel_dir, lines) if lines else None
+            if rules:
+                chain = chain + (rules,)
+            chains[rel_dir] = chain
+        return chains[rel_dir]
+
+    def _dir(rel_dir):
+        if rel_dir in nodes:
+            return nodes[rel_dir]
+        parent_rel, _, name = rel_dir.rpartition("/")
+        parent = _dir(parent_rel)
+        node = None
+        if parent is not None and name not in SKIP_DIRS and not name.startswith('.'):
+            chain = _chain(parent_rel)
+            if not (chain and is_ignored(chain, rel_dir, True)):
+                node = DirNode(name, os.path.join(parent.path, name))
+                parent.dirs.append(node)
+        nodes[rel_dir] = node
+        return node
+
+    for rel_path in rel_paths:
+        rel_dir, _, name = rel_path.rpartition("/")
+        if not _matches(name, extensions):
+            continue
+        node = _dir(rel_dir)
+        if node is None:
+            continue
+        chain = _chain(rel_dir)
+        if chain and is_ignored(chain, rel_path, False):
+            continue
+        node.files.append(make_entry(rel_path, name, os.path.join(node.path, name)))
+
+    def _finish(node):
+        node.files.sort(key=lambda e: e.name)
+        node.dirs = sorted((d for d in node.dirs if _finish(d)), key=lambda d: d.name)
+        return node.dirs or node.files
+
+    _finish(root)
+    return root
+
+
+def _model_listing(root_dir, rel_paths):
+    """A model of exactly rel_paths, for a tree of files the caller already chose.
+
+    Unlike model_from_paths nothing is filtered out: dotfiles, SKIP_DIRS
+    and ignored paths stay, so the tree matches the merged content.
+    """
+    root = DirNode(os.path.basename(root_dir), root_dir)
+    nodes = {"": root}
+    for rel_path in rel_paths:
+        rel_dir, _, name = rel_path.rpartition("/")
+        node, key = root, ""
+        for part in rel_dir.split("/") if rel_dir else ():
+            key = f"{key}/{part}" if key else part
+            if key not in nodes:
+                nodes[key] = DirNode(part, os.path.join(node.path, part))
+                node.dirs.append(nodes[key])
+            node = nodes[key]
+        node.files.append(FileEntry(name, os.path.join(node.path, name)))
+    return root
+
+
+def find_git_dir(path):
+    """Return (worktree_root, git_dir) for the repository containing path, or None."""
+    current = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(current, ".git")
+        if os.path.isdir(dot_git):
+            return current, dot_git
+        if os.path.isfile(dot_git):
+            # Linked worktrees and submodules use a "gitdir: <path>" file
+            with open(dot_git, encoding="utf-8") as f:
+                content = f.read().strip()
+            if content.startswith("gitdir:"):
+                return current, os.path.normpath(os.path.join(current, content[7:].strip()))
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+
+def _index_varint(data, pos):
+    """Decode a git offset-style varint (index v4 prefix length, OFS_DELTA)."""
+    c = data[pos]
+    value = c & 0x7f
+    pos += 1
+    while c & 0x80:
+        c = data[pos]
+        pos += 1
+        value = ((value + 1) << 7) | (c & 0x7f)
+    return value, pos
+
+
+def read_git_index(git_dir):
+    """Yield (path, mode) for each file in the git index, memory-mapping the file.
+
+    Supports index versions 2-4. Submodules, sparse directory entries and
+    skip-worktree files are left out; conflicted paths are listed once.
+    """
+    index_path = os.path.join(git_dir, "index")
+    with open(index_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        signature, version, count = struct.unpack_from(">4sII", data, 0)
+        if signature != b"DIRC" or version not in (2, 3, 4):
+            raise ValueError(f"unsupported git index format: {index_path}")
+        pos = 12
+        name = last = b""
+        for _ in range(count):
+            mode = struct.unpack_from(">I", data, pos + 24)[0]
+            flags = struct.unpack_from(">H", data, pos + 60)[0]
+            header = 62
+            skip_worktree = False
+            if flags & 0x4000 and version >= 3:
+                skip_worktree = bool(struct.unpack_from(">H", data, pos + 62)[0] & 0x4000)
+                header = 64
+            if version == 4:
+                strip, start = _index_varint(data, pos + header)
+                end = data.find(b"\0", start)
+                name = name[:len(name) - strip] + data[start:end]
+                pos = end + 1
+            else:
+                end = data.find(b"\0", pos + header)
+                name = data[pos + header:end]
+                pos += (header + len(name) + 8) & ~7
+            if skip_worktree or (mode >> 12) not in (0o10, 0o12) or name == last:
+                continue
+            last = name
+            yield os.fsdecode(name), mode
+    finally:
+        data.close()
+
+
+def _size_varint(data, pos):
+    """Decode a little-endian base-128 size from a delta header."""
+    value = shift = 0
+    while True:
+        c = data[pos]
+        pos += 1
+        value |= (c & 0x7f) << shift
+        shift += 7
+        if not c & 0x80:
+            return value, pos
+
+
+def _apply_delta(base, delta):
+    """Rebuild an object from its base and a git pack delta."""
+    _, pos = _size_varint(delta, 0)
+    _, pos = _size_varint(delta, pos)
+    out = bytearray()
+    n = len(delta)
+    while pos < n:
+        op = delta[pos]
+        pos += 1
+        if op & 0x80:
+            offset = size = 0
+            for i in range(4):
+                if op & (1 << i):
+                    offset |= delta[pos] << (8 * i)
+                    pos += 1
+            for i in range(3):
+                if op & (0x10 << i):
+                    size |= delta[pos] << (8 * i)
+                    pos += 1
+            out += base[offset:offset + (size or 0x10000)]
+        elif op:
+            out += delta[pos:pos + op]
+            pos += op
+        else:
+            raise ValueError("invalid git delta opcode")
+    return bytes(out)
+
+
+def _inflate(buf, pos, size_hint, limit=None):
+    """Inflate the zlib stream starting at buf[pos]; stop after limit bytes if given."""
+    import zlib
+    d = zlib.decompressobj()
+    out = []
+    produced = 0
+    step = max(size_hint // 2, 1024)
+    while not d.eof:
+        chunk = buf[pos:pos + step]
+        if not chunk:
+            raise ValueError("truncated git object")
+        pos += step
+        data = d.decompress(chunk, limit - produced) if limit else d.decompress(chunk)
+        out.append(data)
+        produced += len(data)
+        if limit and produced >= limit:
+            break
+    return b"".join(out)
+
+
+class GitObjectStore:
+    """Read-only access to the loose and packed objects of a git repository."""
+
+    TYPES = {1: "commit", 2: "tree", 3: "blob", 4: "tag"}
+    BASE_CACHE_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, git_dir):
+        self.git_dir = git_dir
+        # Linked worktrees keep objects and refs in the main repository
+        self.common_dir = git_dir
+        commondir = os.path.join(git_dir, "commondir")
+        if os.path.isfile(commondir):
+            with open(commondir, encoding="utf-8") as f:
+                self.common_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+        self.objects_dir = os.path.join(self.common_dir, "objects")
+        self._packs = None
+        self._bases = {}
+        self._base_bytes = 0
+        self._lock = threading.Lock()
+
+    # -- object lookup --
+
+    def _load_packs(self):
+        packs = []
+        pack_dir = os.path.join(self.objects_dir, "pack")
+        try:
+            names = sorted(os.listdir(pack_dir))
+        except OSError:
+            names = []
+        for name in names:
+            if not name.endswith(".idx"):
+                continue
+            base = os.path.join(pack_dir, name[:-4])
+            try:
+                with open(base + ".idx", "rb") as f:
+                    idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                with open(base + ".pack", "rb") as f:
+                    pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                continue
+            if idx[:8] != b"\xfftOc\x00\x00\x00\x02":
+                continue  # only version 2 pack indexes are supported
+            packs.append((idx, pack, int.from_bytes(idx[8 + 255 * 4:8 + 256 * 4], "big")))
+        self._packs = packs
+        return packs
+
+    def _find_packed(self, sha):
+        """Return (pack, offset) for a binary sha, or None."""
+        for idx, pack, count in self._packs if self._packs is not None else self._load_packs():
+            first = sha[0]
+            lo = int.from_bytes(idx[8 + (first - 1) * 4:8 + first * 4], "big") if first else 0
+            hi = int.from_bytes(idx[8 + first * 4:12 + first * 4], "big")
+            while lo < hi:
+                mid = (lo + hi) // 2
+                probe = idx[1032 + mid * 20:1052 + mid * 20]
+                if probe < sha:
+                    lo = mid + 1
+                elif probe > sha:
+                    hi = mid
+                else:
+                    offsets = 1032 + count * 24
+                    offset = int.from_bytes(idx[offsets + mid * 4:offsets + mid * 4 + 4], "big")
+                    if offset & 0x80000000:
+                        large = offsets + count * 4 + (offset & 0x7fffffff) * 8
+                        offset = int.from_bytes(idx[large:large + 8], "big")
+                    return pack, offset
+        return None
+
+    def _loose_path(self, sha):
+        hexsha = sha.hex()
+        return os.path.join(self.objects_dir, hexsha[:2], hexsha[2:])
+
+    def read(self, sha):
+        """Return (type, data) for a binary or hex object id."""
+        if isinstance(sha, str):
+            sha = bytes.fromhex(sha)
+        found = self._find_packed(sha)
+        if found is not None:
+            return self._read_packed(*found)
+        import zlib
+        try:
+            with open(self._loose_path(sha), "rb") as f:
+                raw = zlib.decompress(f.read())
+        except FileNotFoundError:
+            raise KeyError(sha.hex()) from None
+        header, _, data = raw.partition(b"\0")
+        return header.split(b" ", 1)[0].decode("ascii"), data
+
+    def size(self, sha):
+        """Return an object's size without inflating all of it."""
+        if isinstance(sha, str):
+            sha = bytes.fromhex(sha)
+        found = self._find_packed(sha)
+        if found is not None:
+            pack, offset = found
+            type_, size, pos = self._pack_header(pack, offset)
+            if type_ in self.TYPES:
+                return size
+            if type_ == 6:
+                pos = _index_varint(pack, pos)[1]
+            else:
+                pos += 20
+            delta_head = _inflate(pack, pos, 64, limit=32)
+            return _size_varint(delta_head, _size_varint(delta_head, 0)[1])[0]
+        with open(self._loose_path(sha), "rb") as f:
+            head = _inflate(f.read(4096), 0, 4096, limit=64)
+        return int(head.partition(b"\0")[0].split(b" ", 1)[1])
+
+    @staticmethod
+    def _pack_header(pack, offset):
+        c = pack[offset]
+        type_ = (c >> 4) & 7
+        size = c & 0x0f
+        shift = 4
+        offset += 1
+        while c & 0x80:
+            c = pack[offset]
+            offset += 1
+            size |= (c & 0x7f) << shift
+            shift += 7
+        return type_, size, offset
+
+    def _read_packed(self, pack, offset):
+        # Follow the delta chain down to a full object, then apply deltas upwards
+        deltas = []
+        while True:
+            key = (id(pack), offset)
+            with self._lock:
+                cached = self._bases.get(key)
+            if cached is not None:
+                type_, data = cached
+                break
+            type_, size, pos = self._pack_header(pack, offset)
+            if type_ == 6:
+                distance, pos = _index_varint(pack, pos)
+                deltas.append((key, pack, pos, size))
+                offset -= distance
+            elif type_ == 7:
+                deltas.append((key, pack, pos + 20, size))
+                type_, data = self.read(pack[pos:pos + 20])
+                break
+            elif type_ in self.TYPES:
+                type_, data = self.TYPES[type_], _inflate(pack, pos, size)
+                if deltas:
+                    self._remember(key, type_, data)
+                break
+            else:
+                raise ValueError(f"unknown git pack object type {type_}")
+        for i, (key, delta_pack, pos, size) in enumerate(reversed(deltas)):
+            data = _apply_delta(data, _inflate(delta_pack, pos, size))
+            if i < len(deltas) - 1:
+                self._remember(key, type_, data)
+        return type_, data
+
+    def _remember(self, key, type_, data):
+        """Keep delta bases in a small FIFO cache; siblings often share them."""
+        with self._lock:
+            if key in self._bases or len(data) > self.BASE_CACHE_BYTES // 4:
+                return
+            self._bases[key] = (type_, data)
+            self._base_bytes += len(data)
+            while self._base_bytes > self.BASE_CACHE_BYTES:
+                _, old = self._bases.pop(next(iter(self._bases)))
+                self._base_bytes -= len(old)
+
+    # -- revisions and trees --
+
+    def _read_ref(self, ref, depth=0):
+        for base in (self.git_dir, self.common_dir):
+            try:
+                with open(os.path.join(base, ref), encoding="utf-8") as f:
+                    value = f.read().strip()
+                break
+            except (OSError, UnicodeDecodeError):
+                continue
+        else:
+            value = self._packed_refs().get(ref)
+        if value is None:
+            return None
+        if value.startswith("ref:") and depth < 5:
+            return self._read_ref(value[4:].strip(), depth + 1)
+        return value if re.fullmatch(r"[0-9a-f]{40}", value) else None
+
+    def _packed_refs(self):
+        refs = {}
+        try:
+            with open(os.path.join(self.common_dir, "packed-refs"), encoding="utf-8") as f:
+                for line in f:
+                    if line[:1] not in ("#", "^") and " " in line:
+                        sha, ref = line.strip().split(" ", 1)
+                        refs[ref] = sha
+        except OSError:
+            pass
+        return refs
+
+    def _find_prefix(self, prefix):
+        """Return the unique object id starting with a hex prefix, or None."""
+        matches = set()
+        loose_dir = os.path.join(self.objects_dir, prefix[:2])
+        try:
+            matches.update(prefix[:2] + n for n in os.listdir(loose_dir)
+                           if (prefix[:2] + n).startswith(prefix))
+        except OSError:
+            pass
+        first = int(prefix[:2], 16)
+        for idx, _, count in self._packs if self._packs is not None else self._load_packs():
+            lo = int.from_bytes(idx[8 + (first - 1) * 4:8 + first * 4], "big") if first else 0
+            hi = int.from_bytes(idx[8 + first * 4:12 + first * 4], "big")
+            for i in range(lo, hi):
+                hexsha = idx[1032 + i * 20:1052 + i * 20].hex()
+                if hexsha.startswith(prefix):
+                    matches.add(hexsha)
+        return matches.pop() if len(matches) == 1 else None
+
+    def _parents(self, sha):
+        type_, data = self.read(sha)
+        if type_ != "commit":
+            raise ValueError(f"{sha} is not a commit")
+        return [line[7:].decode("ascii") for line in data.split(b"\n\n", 1)[0].split(b"\n")
+                if line.startswith(b"parent ")]
+
+    def resolve(self, rev):
+        """Resolve a revision (sha, ref, branch, tag, with ~N / ^N suffixes) to a hex id."""
+        m = re.fullmatch(r"(.*?)((?:[~^][0-9]*)*)", rev)
+        name, suffix = m.group(1), m.group(2)
+        sha = None
+        for ref in (name, f"refs/{name}", f"refs/tags/{name}", f"refs/heads/{name}",
+                    f"refs/remotes/{name}", f"refs/remotes/{name}/HEAD"):
+            sha = self._read_ref(ref)
+            if sha:
+                break
+        if sha is None and re.fullmatch(r"[0-9a-fA-F]{4,40}", name):
+            sha = self._find_prefix(name.lower())
+        if sha is None:
+            raise ValueError(f"unknown revision '{rev}'")
+        try:
+            for op in re.findall(r"[~^][0-9]*", suffix):
+                n = int(op[1:]) if op[1:] else 1
+                if op[0] == "~":
+                    for _ in range(n):
+                        sha = self._parents(self.peel(sha, "commit"))[0]
+                elif n:
+                    sha = self._parents(self.peel(sha, "commit"))[n - 1]
+        except (IndexError, KeyError):
+            raise ValueError(f"unknown revision '{rev}'") from None
+        return sha
+
+    def peel(self, sha, want):
+        """Follow tags (and commits, for want='tree') down to an object of type want."""
+        while True:
+            type_, data = self.read(sha)
+            if type_ == want:
+                return sha
+            if type_ == "tag":
+                sha = data.split(b"\n", 1)[0].split(b" ", 1)[1].decode("ascii")
+            elif type_ == "commit" and want == "tree":
+                sha = data.split(b"\n", 1)[0].split(b" ", 1)[1].decode("ascii")
+            else:
+                raise ValueError(f"{sha} is a {type_}, not a {want}")
+
+    def iter_tree(self, sha, prefix=""):
+        """Yield (path, mode, sha) for every non-tree entry under a tree, recursively."""
+        type_, data = self.read(sha)
+        if type_ != "tree":
+            raise ValueError(f"{sha.hex() if isinstance(sha, bytes) else sha} is not a tree")
+        pos = 0
+        while pos < len(data):
+            space = data.index(b" ", pos)
+            nul = data.index(b"\0", space)
+            mode = int(data[pos:space], 8)
+            path = prefix + os.fsdecode(data[space + 1:nul])
+            child = data[nul + 1:nul + 21]
+            pos = nul + 21
+            if mode == 0o40000:
+                yield from self.iter_tree(child, path + "/")
+            else:
+                yield path, mode, child
+
+    def subtree(self, tree_sha, rel_dir):
+        """Return the tree id for rel_dir inside a tree, or raise KeyError."""
+        sha = bytes.fromhex(tree_sha) if isinstance(tree_sha, str) else tree_sha
+        for part in filter(None, rel_dir.split("/")):
+            _, data = self.read(sha)
+            pos = 0
+            found = None
+            while pos < len(data):
+                space = data.index(b" ", pos)
+                nul = data.index(b"\0", space)
+                if data[pos:space] == b"40000" and os.fsdecode(data[space + 1:nul]) == part:
+                    found = data[nul + 1:nul + 21]
+                    break
+                pos = nul + 21
+            if found is None:
+                raise KeyError(f"'{rel_dir}' not found in tree")
+            sha = found
+        return sha
+
+
+def scan_git(root_dir, extensions=None, rev=None, ignore=True):
+    """Build the directory model from git instead of walking the filesystem.
+
+    Without rev, lists the files tracked in the index and reads them from the
+    working tree. With rev, lists the tree of that revision and reads blobs
+    straight from the object store, without checking anything out. Tracked
+    .rttignore files apply unless ignore is False.
+    """
+    ignore_files = (".rttignore",) if ignore else ()
+    found = find_git_dir(root_dir)
+    if found is None:
+        raise ValueError(f"'{root_dir}' is not inside a git repository")
+    work_root, git_dir = found
+    prefix = os.path.relpath(root_dir, work_root).replace(os.sep, "/")
+    prefix = "" if prefix == "." else prefix + "/"
+
+    if rev is None:
+        # Symlinks are followed like in a walk, except those pointing at directories
+        paths = []
+        for path, mode in read_git_index(git_dir):
+            if not path.startswith(prefix):
+                continue
+            if (mode >> 12) == 0o12:
+                if _stats is not None:
+                    _stats.count_stat()
+                if os.path.isdir(os.path.join(work_root, path)):
+                    continue
+            paths.append(path[len(prefix):])
+
+        def read_ignore(rel_path):
+            with open(os.path.join(root_dir, rel_path), encoding="utf-8", errors="ignore") as f:
+                return f.read()
+        return model_from_paths(root_dir, paths, extensions, read_ignore=read_ignore,
+                                ignore_files=ignore_files)
+
+    store = GitObjectStore(git_dir)
+    tree = store.peel(store.resolve(rev), "tree")
+    entries = {path: (mode, sha) for path, mode, sha in store.iter_tree(store.subtree(tree, prefix))}
+    blobs = {}
+    for path, (mode, sha) in entries.items():
+        # Follow symlinks to files within the tree, as a walk of a checkout would
+        current, hops = path, 0
+        while (mode >> 12) == 0o12 and hops < 8:
+            target = store.read(sha)[1].decode("utf-8", "surrogateescape")
+            current = posixpath.normpath(posixpath.join(posixpath.dirname(current), target))
+            mode, sha = entries.get(current, (0, None))
+            hops += 1
+        if (mode >> 12) == 0o10:
+            blobs[path] = sha
+
+    def read_blob(sha):
+        return store.read(sha)[1]
+
+    def make_entry(rel_path, name, path):
+        sha = blobs[rel_path]
+        return FileEntry(name, path, loader=lambda: read_blob(sha),
+                         size=lambda: store.size(sha))
+
+    def read_ignore(rel_path):
+        return read_blob(blobs[rel_path]).decode("utf-8", "ignore")
+    return model_from_paths(root_dir, blobs, extensions, make_entry, read_ignore, ignore_files)
+
+
+def _archive_member_path(name):
+    """Normalize an archive member name to a relative '/' path, or None if it escapes."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return None
+    return "/".join(parts)
+
+
+def _archive_wanted(rel_path, extensions):
+    """Whether a member can end up in the model (ignore rules aside)."""
+    rel_dir, _, name = rel_path.rpartition("/")
+    if rel_dir and any(d in SKIP_DIRS or d.startswith('.') for d in rel_dir.split("/")):
+        return False
+    return name in IGNORE_FILES or _matches(name, extensions)
+
+
+def is_archive(path):
+    """True for a .zip file or a (possibly compressed) tar archive."""
+    import tarfile
+    import zipfile
+    if not os.path.isfile(path):
+        return False
+    return zipfile.is_zipfile(path) or tarfile.is_tarfile(path)
+
+
+def scan_archive(archive_path, extensions=None, ignore=True, max_file_size=None):
+    """Build the directory model from a .zip or tar archive, without extracting it.
+
+    The archive acts as the root directory: entries are archive_path/<member>.
+    Zip members are listed from the central directory and read on demand.
+    Tar archives, compressed or not, are read in one sequential pass; as the
+    tree comes before any content, matching members are kept in memory
+    (except those over max_file_size, which are skipped anyway).
+    Symlinks to files inside the archive are followed. Close the model once
+    its files are read to close a zip.
+    """
+    import tarfile
+    import zipfile
+
+    members = {}  # rel_path -> (size, loader)
+    links = {}  # rel_path -> symlink target, relative to the link's directory
+    zf = None
+    try:
+        if zipfile.is_zipfile(archive_path):
+            zf = zipfile.ZipFile(archive_path)
+            for info in zf.infolist():
+                rel_path = _archive_member_path(info.filename)
+                if rel_path is None or info.is_dir():
+                    continue
+                if (info.external_attr >> 16) >> 12 == 0o12:
+                    links[rel_path] = zf.read(info).decode("utf-8", "surrogateescape")
+                else:
+                    members[rel_path] = (info.file_size, lambda info=info: zf.read(info))
+        else:
+            with tarfile.open(archive_path, "r|*") as tf:
+                for member in tf:
+                    rel_path = _archive_member_path(member.name)
+                    if rel_path is None:
+                        continue
+                    if member.issym():
+                        links[rel_path] = member.linkname
+                    elif member.islnk():
+                        # Hard links name their target relative to the archive root
+                        target = _archive_member_path(member.linkname)
+                        if target in members:
+                            members[rel_path] = members[target]
+                    elif member.isreg() and _archive_wanted(rel_path, extensions):
+                        data = None
+                        if max_file_size is None or member.size <= max_file_size:
+                            data = tf.extractfile(member).read()
+                        members[rel_path] = (member.size, lambda data=data: data)
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError) as e:
+        if zf is not None:
+            zf.close()
+        raise ValueError(f"can't read archive '{archive_path}': {e}") from None
+
+    for rel_path, target in links.items():
+        current, hops = rel_path, 0
+        while hops < 8:
+            current = posixpath.normpath(posixpath.join(posixpath.dirname(current), target))
+            if current in members:
+                members[rel_path] = members[current]
+                break
+            if current not in links:
+                break
+            target = links[current]
+            hops += 1
+
+    def make_entry(rel_path, name, path):
+        size, loader = members[rel_path]
+        return FileEntry(name, path, loader=loader, size=size)
+
+    def read_ignore(rel_path):
+        return members[rel_path][1]().decode("utf-8", "ignore")
+    model = model_from_paths(archive_path, members, extensions, make_entry, read_ignore,
+                             IGNORE_FILES if ignore else ())
+    if zf is not None:
+        model.closer = zf.close
+    return model
+
+
+def is_binary(head, final=False):
+    """Return True if a leading block of bytes has NULs or isn't valid UTF-8."""
+    if b"\0" in head:
+        return True
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final)
+    except UnicodeDecodeError:
+        return True
+    return False
+
+
+def _sniffs_binary(data):
+    """is_binary on data's first SNIFF_BYTES, which are the whole file if data holds no more."""
+    return is_binary(data[:SNIFF_BYTES], final=len(data) <= SNIFF_BYTES)
+
+
+def _read_sniffed_timed(entry):
+    """_read_sniffed for --stats: read all bytes first so reading and decoding time apart.
+
+    As untimed, a file on disk is read past its first SNIFF_BYTES only if
+    those don't look binary.
+    """
+    start = time.perf_counter()
+    if entry.loader is not None:
+        data = entry.loader()
+        binary = _sniffs_binary(data)
+    else:
+        with open(entry.path, "rb") as f:
+            data = f.read(SNIFF_BYTES + 1)  # one more tells whether the file ends within the sniff
+            binary = _sniffs_binary(data)
+            if not binary:
+                data += f.read()
+    read_done = time.perf_counter()
+    _stats.add("read", read_done - start, 1, len(data))
+    if binary:
+        return None
+    text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="ignore").read()
+    _stats.add("decode", time.perf_counter() - read_done)
+    return text
+
+
+def _read_sniffed(entry):
+    """Read an entry as text, or return None without decoding it if it looks binary."""
+    if _stats is not None:
+        return _read_sniffed_timed(entry)
+    if entry.loader is not None:
+        data = entry.loader()
+        if _sniffs_binary(data):
+            return None
+        return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", errors="ignore").read()
+    with open(entry.path, "rb") as f:
+        if _sniffs_binary(f.read(SNIFF_BYTES + 1)):
+            return None
+        f.seek(0)
+        return io.TextIOWrapper(f, encoding="utf-8", errors="ignore").read()
+
+
+class ContentCache:
+    """On-disk cache of decoded file contents for one root directory.
+
+    Entries are keyed by path and only served while the file's (mtime, size,
+    inode) still match. Binary files are remembered without their content.
+    One run adds at most max_bytes of new content. Once the cache grows past
+    max_bytes the least recently used entries are evicted on close, and the
+    pages they held are handed back to the filesystem. Use times live in a
+    table of their own, so stamping a hit never rewrites its content.
+    """
+
+    SCHEMA_VERSION = 3
+
+    def __init__(self, root_dir, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        import sqlite3
+        cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        os.makedirs(cache_dir, exist_ok=True)
+        key = hashlib.sha1(root_dir.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, f"{key}.sqlite")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._used = []
+        self._added = 0
+        self._now = time.time()
+        self._error = sqlite3.Error
+        self.db = sqlite3.connect(self.path)
+        if self.db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            # Only takes effect once the file is rebuilt; cheap while it is new
+            self.db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self.db.execute("VACUUM")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            self.db.execute("DROP TABLE IF EXISTS files")
+            self.db.execute("DROP TABLE IF EXISTS used")
+            self.db.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+        self.db.execute("CREATE TABLE IF NOT EXISTS files ("
+                        "path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, ino INTEGER, "
+                        "content TEXT, skip TEXT, nbytes INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS used ("
+                        "path TEXT PRIMARY KEY, used REAL) WITHOUT ROWID")
+
+    @staticmethod
+    def _key(entry):
+        st = entry.stat()
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def get(self, entry):
+        """Return cached (content, skip_reason) for entry, or None if missing or stale."""
+        try:
+            key = self._key(entry)
+            row = self.db.execute("SELECT mtime, size, ino, content, skip FROM files "
+                                  "WHERE path = ?", (entry.path,)).fetchone()
+        except (OSError, self._error):
+            row = None
+        if row is None or tuple(row[:3]) != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used.append((entry.path, self._now))
+        return row[3], row[4]
+
+    def put(self, entry, content, skip=None):
+        nbytes = len(content or "")
+        if self._added + nbytes > self.max_bytes:
+            return  # close() would evict it again
+        try:
+            mtime, size, ino = self._key(entry)
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (entry.path, mtime, size, ino, content, skip, nbytes))
+            self._used.append((entry.path, self._now))
+            self._added += nbytes
+        except (OSError, self._error):
+            pass
+
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for path, nbytes in self.db.execute("SELECT path, nbytes FROM files "
+                                            "LEFT JOIN used USING (path) ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            stale.append((path,))
+            total -= nbytes
+        self.db.executemany("DELETE FROM files WHERE path = ?", stale)
+        self.db.executemany("DELETE FROM used WHERE path = ?", stale)
+        self.db.commit()
+        self.db.executescript("PRAGMA incremental_vacuum;")  # execute() frees one page
+
+    def close(self):
+        """Record hit times, evict down to max_bytes and commit."""
+        try:
+            self.db.executemany("INSERT OR REPLACE INTO used VALUES (?, ?)", self._used)
+            self._evict()
+            self.db.commit()
+        except self._error:
+            pass
+        finally:
+            self.db.close()
+
+
+def _as_entry(f):
+    """Accept either a FileEntry or a plain path."""
+    return f if isinstance(f, FileEntry) else FileEntry(os.path.basename(f), f)
+
+
+def _too_large(entry, max_file_size):
+    return max_file_size is not None and entry.size > max_file_size
+
+
+def _lookup(cache, entry, max_file_size):
+    if cache is None or _too_large(entry, max_file_size):
+        return None
+    return cache.get(entry)
+
+
+def _load(entry, cached=None, max_file_size=None):
+    """Classify and read one entry.
+
+    Returns (content, skip_reason, fresh): content is None when the file is
+    skipped, and fresh marks a disk read whose result may be cached.
+    """
+    if _too_large(entry, max_file_size):
+        return None, "too large", False
+    if cached is not None:
+        return cached[0], cached[1], False
+    try:
+        content = _read_sniffed(entry)
+    except Exception as e:
+        return f"Error reading file: {e}", None, False
+    if content is None:
+        return None, "binary", True
+    return content, None, True
+
+
+def _read_batch(batch, max_file_size=None):
+    return [_load(entry, cached, max_file_size) for entry, cached in batch]
+
+
+def _iter_batches(files, cache, max_file_size, max_files=32, max_bytes=1024 * 1024):
+    """Group consecutive entries into ([(entry, cached)], total_size) read batches."""
+    batch, batch_bytes = [], 0
+    for entry in files:
+        cached = _lookup(cache, entry, max_file_size)
+        size = entry.size
+        if batch and (len(batch) >= max_files or batch_bytes + size > max_bytes):
+            yield batch, batch_bytes
+            batch, batch_bytes = [], 0
+        batch.append((entry, cached))
+        batch_bytes += size
+    if batch:
+        yield batch, batch_bytes
+
+
+def iter_contents(files, jobs=1, max_inflight=MAX_INFLIGHT_BYTES, cache=None,
+                  max_file_size=None):
+    """Yield (FileEntry, content, skip_reason) triples in input order.
+
+    Files larger than max_file_size, or whose first SNIFF_BYTES look binary,
+    are yielded with content None and the reason they were skipped.
+    With jobs > 1, small batches of files are read ahead on a thread pool
+    while keeping at most max_inflight bytes read but not yet consumed.
+    Cache lookups and stores happen on the calling thread.
+    """
+    files = (_as_entry(f) for f in files)
+    if jobs <= 1:
+        for entry in files:
+            cached = _lookup(cache, entry, max_file_size)
+            content, skip, fresh = _load(entry, cached, max_file_size)
+            if fresh and cache is not None:
+                cache.put(entry, content, skip)
+            yield entry, content, skip
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+    batches = _iter_batches(files, cache, max_file_size)
+    pending = deque()
+    inflight = 0
+    exhausted = False
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        try:
+            while True:
+                # Always admit one batch, even if it alone exceeds the cap
+                while (not exhausted and len(pending) < jobs * 4
+                       and (not pending or inflight < max_inflight)):
+                    item = next(batches, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    batch, size = item
+                    pending.append((batch, size, pool.submit(_read_batch, batch, max_file_size)))
+                    inflight += size
+                if not pending:
+                    break
+                batch, size, future = pending.popleft()
+                inflight -= size
+                for (entry, _), (content, skip, fresh) in zip(batch, future.result()):
+                    if fresh and cache is not None:
+                        cache.put(entry, content, skip)
+                    yield entry, content, skip
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+
+
+class Deduplicator:
+    """Content digests of merged files, so later identical copies can point at the first."""
+
+    def __init__(self):
+        self.seen = {}  # digest -> rel_path of the first copy
+        self.duplicates = 0
+        self.bytes_saved = 0
+
+    def check(self, rel_path, content):
+        """Return the rel_path of an earlier identical file, or None after recording this one."""
+        if not content:
+            return None
+        data = content.encode("utf-8", "surrogatepass")
+        first = self.seen.setdefault(hashlib.blake2b(data, digest_size=16).digest(), rel_path)
+        if first is rel_path:
+            return None
+        self.duplicates += 1
+        self.bytes_saved += len(data)
+        return first
+
+
+class _CommentSyntax:
+    """What _strip_comments needs to know about a language's comments and strings.
+
+    Strings in long_strings may span lines and are closed by the same
+    delimiter; strings in quotes end on their line. Both honour backslash
+    escapes. Strings in raw_strings span lines too, but a backslash in them
+    is just a character (Go's `raw strings`). With regex_literals, a slash
+    where an operand is expected opens a JavaScript-style /regex/, which may
+    well hold "//". With docstrings, long strings that are Python docstrings
+    go too.
+
+    Some comments are read by the toolchain and always stay: the lines at
+    the top of a file that header matches (a shebang, Python's coding
+    line), comments that directives matches at their start (Go's
+    //go:build) and the comment right above the code preamble_of (cgo's
+    import "C").
+    """
+
+    def __init__(self, line_comment, block_comments=(), long_strings=(), quotes="\"'",
+                 regex_literals=False, docstrings=False, raw_strings=(), header=None,
+                 directives=None, preamble_of=None):
+        self.line_comment = line_comment
+        self.block_comments = block_comments  # (opener, closer) pairs
+        self.long_strings = long_strings
+        self.raw_strings = raw_strings
+        self.regex_literals = regex_literals
+        self.docstrings = docstrings
+        self.header = header and re.compile(header)
+        self.directives = directives and re.compile(directives)
+        self.preamble_of = preamble_of
+        openers = (line_comment,) + tuple(o for o, _ in block_comments)
+        comments = [rf'{re.escape(line_comment)}[^\n]*']
+        for opener, closer in block_comments:  # an unrolled loop that stops at the first closer
+            c0, c1 = re.escape(closer[0]), re.escape(closer[1])
+            comments.append(rf'{re.escape(opener)}[^{c0}]*{c0}+(?:[^{c0}{c1}][^{c0}]*{c0}+)*{c1}')
+        comment = "|".join(comments)
+
+        # A scanner match steps over code and one-line strings in one go and
+        # stops at the next comment, long or raw string, slash or the end
+        delimiters = long_strings + raw_strings
+        stops = {o[0] for o in openers} | {d[0] for d in delimiters} | set(quotes)
+        skip = ["[^" + re.escape("".join(sorted(stops))) + "]+"]
+        for q in quotes:
+            e = re.escape(q)
+            not_long = f"(?!{e}{e})" if q * 3 in long_strings else ""
+            skip.append(rf'{e}{not_long}[^{e}\\\n]*(?:\\.[^{e}\\\n]*)*{e}')
+        for c in sorted(stops - {d[0] for d in delimiters}):
+            # The first character of a comment opener or quote that opens nothing here
+            rests = [re.escape(o[1:]) for o in openers if o[0] == c]
+            if "" in rests or (regex_literals and c == "/"):
+                continue
+            skip.append(re.escape(c) + (f"(?!{'|'.join(rests)})" if rests else ""))
+        # Long and raw strings stop the scan at their opening delimiter;
+        # _find_closer finds the closing one with str.find
+        tokens = []
+        self.closers = {}
+        for kind, strings in (("long", long_strings), ("raw", raw_strings)):
+            for n, delimiter in enumerate(strings):
+                tokens.append(rf'(?P<{kind}{n}>{re.escape(delimiter)})')
+                self.closers[f"{kind}{n}"] = delimiter
+        if regex_literals:
+            tokens.append(r'(?P<slash>/)')
+        # Anything else (an unterminated opener) is passed over a character at a time
+        tokens.append(r'\Z|(?P<stray>.)')
+        skip, tokens = "|".join(skip), "|".join(tokens)
+        self.scanner = re.compile(rf'(?:{skip})*(?:(?P<comment>{comment})|{tokens})', re.S)
+        # From the start of a line, a run of lines holding nothing but comments goes in one match
+        kept = f"(?!{directives})" if directives else ""
+        self.line_scanner = re.compile(
+            rf'(?P<lines>(?:[ \t]*{kept}(?:{comment})[ \t]*(?:\n|\Z))+)|{self.scanner.pattern}',
+            re.S)
+        # Keeping the comments, only the strings that may span lines matter
+        self.string_scanner = re.compile(rf'(?:{comment}|{skip})*(?:{tokens})', re.S)
+        # Markers that make a line worth scanning; other lines are code (or
+        # inside a token already stepped over) and are never looked at.
+        # str.find locates them far quicker than any regex would.
+        self.triggers = tuple(dict.fromkeys(openers + delimiters))
+        self.string_triggers = tuple(dict.fromkeys(openers[1:] + delimiters))
+
+
+# A shebang and a PEP 263 coding declaration, which may follow it or any comment line
+_PYTHON_SYNTAX = _CommentSyntax(
+    "#", long_strings=('"""', "'''"), docstrings=True,
+    header=r'#![^\n]*(?:\n|\Z)(?:[ \t\f]*#[^\n]*coding[:=][^\n]*(?:\n|\Z))?'
+           r'|(?:[ \t\f]*#[^\n]*\n)?[ \t\f]*#[^\n]*coding[:=][^\n]*(?:\n|\Z)')
+_C_SYNTAX = _CommentSyntax("//", (("/*", "*/"),), long_strings=('"""', "`"),
+                           regex_literals=True)
+_GO_SYNTAX = _CommentSyntax("//", (("/*", "*/"),), raw_strings=("`",),
+                            directives=r'//(?:go:|line |export )|// \+build',
+                            preamble_of='import "C"')
+_REGEX_LITERAL = re.compile(r'/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/')
+# What can come right before a regex literal, as opposed to a division
+_BEFORE_REGEX = tuple("(,=:[!&|?{};") + ("return", "typeof", "case")
+
+
+def _find_closer(text, delimiter, pos):
+    """Index just past the first unescaped delimiter at or after pos, or len(text)."""
+    while True:
+        end = text.find(delimiter, pos)
+        if end < 0:
+            return len(text)
+        escapes = end
+        while escapes > pos and text[escapes - 1] == "\\":
+            escapes -= 1
+        if (end - escapes) % 2 == 0:
+            return end + len(delimiter)
+        pos = end + 1
+
+
+def _code_line(text, start, end, step, comment):
+    """First line in text[start:end], or last if step < 0, that isn't blank or a comment."""
+    while start < end:
+        if step > 0:
+            nl = text.find("\n", start, end)
+            line, start = (text[start:end], end) if nl < 0 else (text[start:nl], nl + 1)
+        else:
+            nl = text.rfind("\n", start, end)
+            line, end = text[nl + 1:end], max(nl, start)
+        stripped = line.strip()
+        if stripped and not stripped.startswith(comment):
+            return line
+    return None
+
+
+def _is_docstring(text, line_start, start, end, syntax):
+    """Whether the long string at start, first on its line, is a docstring worth dropping.
+
+    That is the module's first statement, or the first statement of a block
+    indented under a "...:" header line (which rules out a dict value on the
+    next line). A block's docstring only goes while the block continues
+    after it at the same indentation, so a docstring-only body stays valid.
+    """
+    head = text[line_start:start]
+    indent = head[:len(head) - len(head.lstrip(" \t"))]
+    if head[len(indent):] not in ("", "r", "u", "R", "U"):
+        return False
+    header = _code_line(text, 0, max(line_start - 1, 0), -1, syntax.line_comment)
+    if header is None:
+        return True
+    if syntax.line_comment in header:  # a trailing comment, most likely
+        header = header[:header.index(syntax.line_comment)]
+    if not header.rstrip().endswith(":") or len(header) - len(header.lstrip()) >= len(indent):
+        return False
+    after = _code_line(text, end + 1, len(text), 1, syntax.line_comment)
+    return after is not None and after.startswith(indent) and after[len(indent)] not in " \t"
+
+
+def _strip_comments(text, syntax, strip=True):
+    """Remove comments (and docstrings) from source; one alone on its lines takes them along.
+
+    Return the new text and the (start, end) spans in it of the strings that
+    run over several lines, which _squeeze must leave be. With strip=False
+    nothing is removed and only those spans are looked for.
+
+    syntax.triggers skip the lines that cannot hold a comment or long string,
+    and the scanners step over code and one-line strings in C, so only
+    comments, long strings and the odd slash come back to Python.
+    """
+    pieces = []
+    spans = []
+    last = 0  # text[:last] is settled in pieces
+    out = 0  # length of the pieces so far
+    size = len(text)
+    header = strip and syntax.header and syntax.header.match(text)
+    pos = header.end() if header else 0
+    scanner, line_scanner = (syntax.scanner, syntax.line_scanner) if strip else (
+        syntax.string_scanner, syntax.string_scanner)
+    # The next place of each trigger, -1 once there are no more
+    upcoming = [[text.find(trigger), trigger]
+                for trigger in (syntax.triggers if strip else syntax.string_triggers)]
+    while True:
+        first = size
+        for entry in upcoming:
+            if 0 <= entry[0] < pos:
+                entry[0] = text.find(entry[1], pos)
+            if 0 <= entry[0] < first:
+                first = entry[0]
+        if first == size:
+            break
+        done = pos  # the end of the previous token
+        # Short strings end on their line, so its start is in code unless
+        # a backslash carries one over from the line above
+        line_start = text.rfind("\n", pos, first) + 1 or pos
+        while line_start > pos + 1 and text[line_start - 2] == "\\":
+            line_start = text.rfind("\n", pos, line_start - 1) + 1 or pos
+        if line_start and text[line_start - 1] != "\n":
+            match = scanner.match(text, line_start)
+        else:
+            match = line_scanner.match(text, line_start)
+        kind = match.lastgroup
+        if kind is None:
+            break
+        start, pos = match.span(kind)
+        if kind in syntax.closers:
+            closer = syntax.closers[kind]
+            if kind.startswith("long"):
+                pos = _find_closer(text, closer, pos)
+            else:  # a raw string knows no escapes
+                end = text.find(closer, pos)
+                pos = size if end < 0 else end + len(closer)
+        if kind == "lines":
+            if syntax.preamble_of and text.startswith(syntax.preamble_of, pos):
+                continue
+            pieces.append(text[last:start])
+            out += start - last
+            last = pos
+            continue
+        if kind == "comment":
+            if syntax.directives and syntax.directives.match(text, start):
+                continue
+        elif kind == "slash":
+            before = text[max(0, start - 16):start].rstrip(" \t")
+            if not before or before.endswith(("\n",) + _BEFORE_REGEX):
+                literal = _REGEX_LITERAL.match(text, start)
+                if literal:
+                    pos = literal.end()
+            continue
+        elif kind == "stray":
+            continue
+        elif not (strip and syntax.docstrings) and text.find("\n", start, pos) < 0:
+            continue  # a one-line string
+        line_start = text.rfind("\n", 0, start) + 1
+        while line_start > done + 1 and text[line_start - 2] == "\\":  # code may run on from above
+            line_start = text.rfind("\n", 0, line_start - 1) + 1
+        alone = line_start >= last and not text[line_start:start].strip()
+        if kind == "comment":
+            end = text.find("\n", pos)
+            end = size if end < 0 else end
+            if alone and not text[pos:end].strip():
+                pieces.append(text[last:line_start])
+                out += line_start - last
+                last = pos = end + 1
+                continue
+            pieces.append(text[last:start].rstrip(" \t"))
+            out += len(pieces[-1])
+            last = pos
+            continue
+        if strip and syntax.docstrings and kind.startswith("long") and line_start >= last:
+            end = text.find("\n", pos)
+            end = size if end < 0 else end
+            if not text[pos:end].strip() and _is_docstring(text, line_start, start, end, syntax):
+                pieces.append(text[last:line_start])
+                out += line_start - last
+                last = pos = end + 1
+                while True:  # and the blank lines after it
+                    nl = text.find("\n", last)
+                    if nl < 0 or text[last:nl].strip():
+                        break
+                    last = pos = nl + 1
+                continue
+        if text.find("\n", start, pos) >= 0:
+            spans.append((out + start - last, out + pos - last))
+    if not pieces:
+        return text, spans
+    pieces.append(text[last:])
+    return "".join(pieces), spans
+
+
+_BLANK_LINES = re.compile(r'\n\n\n+')
+
+
+def _squeeze_run(text):
+    # str's own searches run far ahead of a regex that tries every space
+    if " \n" in text or "\t" in text and "\t\n" in text:
+        lines = text.split("\n")
+        lines[:-1] = [line.rstrip(" \t") for line in lines[:-1]]  # the last runs on into a string
+        text = "\n".join(lines)
+    if "\n\n\n" in text:
+        text = _BLANK_LINES.sub("\n\n", text)
+    return text
+
+
+def _squeeze(text, spans=()):
+    """Drop trailing whitespace and leading blank lines; keep at most one blank line in a row.
+
+    The (start, end) spans of text, strings running over several lines, are kept as they are.
+    """
+    pieces = []
+    last = 0
+    for start, end in spans:
+        pieces.append(_squeeze_run(text[last:start]))
+        pieces.append(text[start:end])
+        last = end
+    pieces.append(_squeeze_run(text[last:]).rstrip(" \t"))
+    text = "".join(pieces)
+    squeezed = text.strip("\n")
+    return squeezed + "\n" if squeezed and text.endswith("\n") else squeezed
+
+
+_SYNTAX_BY_EXT = dict.fromkeys(C_FAMILY_EXTS, _C_SYNTAX)
+_SYNTAX_BY_EXT.update(dict.fromkeys(PYTHON_EXTS, _PYTHON_SYNTAX))
+_SYNTAX_BY_EXT[".go"] = _GO_SYNTAX
+
+
+def _compact_source(text, syntax, strip=True):
+    """Source squeezed outside its multi-line strings, and without comments if strip."""
+    return _squeeze(*_strip_comments(text, syntax, strip))
+
+
+def _utf8_len(text):
+    return len(text) if text.isascii() else len(text.encode("utf-8", "surrogatepass"))
+
+
+class Compactor:
+    """Shrink file contents for --compact, keeping count of what that saved.
+
+    "light" only trims trailing whitespace and runs of blank lines, in every
+    file. "aggressive" also strips comments from Python and C-family sources,
+    and docstrings from Python. In those sources, string literals are always
+    left as they are.
+    """
+
+    def __init__(self, level="light"):
+        if level not in COMPACT_LEVELS:
+            raise ValueError(f"unknown compact level {level!r} "
+                             f"(choose from {', '.join(COMPACT_LEVELS)})")
+        self.level = level
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_saved = 0
+        self.tokens_saved = 0
+
+    def compact(self, rel_path, content):
+        """Return content compacted according to the file's extension."""
+        start = time.perf_counter() if _stats is not None else None
+        syntax = _SYNTAX_BY_EXT.get(os.path.splitext(rel_path)[1].lower())
+        if syntax is None:
+            text = _squeeze(content)
+        else:
+            text = _compact_source(content, syntax, strip=self.level == "aggressive")
+        size = _utf8_len(content)
+        self.files += 1
+        self.bytes_in += size
+        self.bytes_saved += size - _utf8_len(text)
+        self.tokens_saved += estimate_tokens(content) - estimate_tokens(text)
+        if start is not None:
+            _stats.add("compact", time.perf_counter() - start)
+        return text
+
+
+_QUANTIFIER = re.compile(r'[*?+]|\{\d*(?:,\d*)?\}')
+_ESCAPE_ARGS = {"x": 2, "u": 4, "U": 8}  # digits an escape consumes
+
+
+def _required_literal(pattern):
+    """The longest literal that every match of pattern contains, or "" if there is none.
+
+    Only literal runs outside groups and classes count, so the answer errs
+    short; a top-level "|" or inline flags such as (?i) give up entirely.
+    """
+    best = run = ""
+    depth = i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        atom = None
+        if c == "\\":
+            escaped = pattern[i:i + 1]
+            i += 1
+            if escaped and not escaped.isalnum():  # \d, \b, \1, \n and so on are no literals
+                atom = escaped
+            elif escaped in _ESCAPE_ARGS:  # \x41, \u0041 and \U00000041 end the run too
+                i += _ESCAPE_ARGS[escaped]
+            elif escaped == "N" and pattern.startswith("{", i):
+                i = pattern.find("}", i) + 1 or len(pattern)
+            elif escaped.isdigit():  # a group reference or an octal escape
+                while i < len(pattern) and pattern[i].isdigit():
+                    i += 1
+        elif c == "[":
+            i += pattern[i:i + 1] == "^"
+            i += pattern[i:i + 1] == "]"
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+            i += 1
+        elif c == "(":
+            if pattern.startswith("?", i) and pattern[i + 1:i + 2].isalpha() and \
+                    pattern[i + 1] != "P":
+                return ""
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|":
+            if depth == 0:
+                return ""
+        elif c not in ".^$":
+            atom = c
+        quantifier = c != "(" and _QUANTIFIER.match(pattern, i)
+        if quantifier:
+            i = quantifier.end()
+            i += pattern[i:i + 1] in ("?", "+")  # lazy or possessive
+            if atom is not None and quantifier.group() == "+":
+                run += atom  # at least one copy, but what follows may be another
+            atom = None
+        if atom is not None and depth == 0:
+            run += atom
+        else:
+            best = max(best, run, key=len)
+            run = ""
+    return max(best, run, key=len)
+
+
+class Grep:
+    """Select files by content for --grep, and cut them down to their matches.
+
+    Files are mapped with mmap (archive and git members come from their
+    loader) and searched as bytes for the longest literal every match must
+    contain, so most of them are dismissed without being decoded or seen by
+    the regex engine. ^ and $ match at line boundaries, as in grep, and
+    binary files never match. With context, excerpt()
+    keeps only that many lines either side of each match.
+    """
+
+    def __init__(self, pattern, context=None):
+        self.pattern = pattern
+        self.regex = re.compile(pattern, re.MULTILINE)
+        self.context = context
+        literal = _required_literal(pattern)
+        self.literal = literal.encode("utf-8")
+        # A pattern that is just its literal needs no regex once the literal is found
+        self.exact = bool(literal) and pattern in (literal, re.escape(literal))
+
+    def _search(self, data):
+        if _sniffs_binary(data):
+            return False
+        if self.literal and data.find(self.literal) < 0:
+            return False
+        if self.exact:
+            return True
+        return self.regex.search(str(data, "utf-8", "ignore")) is not None
+
+    def matches(self, entry):
+        """Whether entry's content matches the pattern; unreadable files don't."""
+        try:
+            if entry.loader is not None:
+                return self._search(entry.loader())
+            with open(entry.path, "rb") as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # an empty file can't be mapped
+                    return self._search(b"")
+                with data:
+                    return self._search(data)
+        except (OSError, KeyError, ValueError):
+            return False
+
+    def _match_batch(self, batch):
+        return [self.matches(entry) for entry in batch]
+
+    def filter(self, files, jobs=1, max_file_size=None):
+        """Return the files (paths or FileEntry objects, as entries) that match, in order.
+
+        Files over max_file_size are left out unsearched. With jobs > 1,
+        batches of files are searched on a thread pool.
+        """
+        files = [e for e in map(_as_entry, files) if not _too_large(e, max_file_size)]
+        if jobs <= 1:
+            return [entry for entry in files if self.matches(entry)]
+        from concurrent.futures import ThreadPoolExecutor
+        batches = [files[i:i + GREP_BATCH_FILES] for i in range(0, len(files), GREP_BATCH_FILES)]
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            hits = [hit for batch in pool.map(self._match_batch, batches) for hit in batch]
+        return [entry for entry, hit in zip(files, hits) if hit]
+
+    def excerpt(self, content):
+        """content cut down to the lines around each match, or all of it without context.
+
+        Each run of lines starts with a "[lines a-b]" marker (1-based, inclusive).
+        """
+        if self.context is None:
+            return content
+        ends = [m.start() for m in re.finditer("\n", content)]  # line i ends at ends[i]
+        spans = []
+        for match in self.regex.finditer(content):
+            first = bisect.bisect_left(ends, match.start()) - self.context
+            last = bisect.bisect_left(ends, max(match.end() - 1, match.start())) + self.context
+            first, last = max(first, 0), min(last, len(ends) - (content.endswith("\n")))
+            if spans and first <= spans[-1][1] + 1:
+                spans[-1][1] = max(spans[-1][1], last)
+            else:
+                spans.append([first, last])
+        if not spans:
+            return content
+        pieces = []
+        for first, last in spans:
+            start = ends[first - 1] + 1 if first else 0
+            end = ends[last] + 1 if last < len(ends) else len(content)
+            pieces.append(f"[lines {first + 1}-{last + 1}]\n{content[start:end]}")
+        return "\n".join(piece if piece.endswith("\n") else piece + "\n" for piece in pieces)
+
+
+def _prune_model(node, keep):
+    """Drop files whose id() isn't in keep, and the directories that leaves empty."""
+    node.files = [entry for entry in node.files if id(entry) in keep]
+    node.dirs = [d for d in node.dirs if _prune_model(d, keep)]
+    return node.dirs or node.files
+
+
+def _iter_processed(root_dir, files, jobs=1, cache=None, max_file_size=None, skipped=None,
+                    dedup=None, compact=None, grep=None):
+    """Yield (entry, rel_path, content, skip_reason, identical_to) per file in order.
+
+    content is None for a skipped file and for a duplicate, which names the
+    rel_path of its first copy in identical_to.
+    """
+    records = iter_contents(files, jobs, cache=cache, max_file_size=max_file_size)
+    for entry, content, skip in records:
+        rel_path = os.path.relpath(entry.path, root_dir)
+        if skip:
+            if skipped is not None:
+                skipped[skip] += 1
+            yield entry, rel_path, None, skip, None
+            continue
+        if dedup is not None:
+            first = dedup.check(rel_path, content)
+            if first is not None:
+                yield entry, rel_path, None, None, first
+                continue
+        if grep is not None:
+            content = grep.excerpt(content)
+        if compact is not None:
+            content = compact.compact(rel_path, content)
+        yield entry, rel_path, content, None, None
+
+
+def iter_documents(root_dir, files, jobs=1, cache=None, max_file_size=None, skipped=None,
+                   dedup=None, compact=None, grep=None):
+    """Yield (rel_path, content) per file in order.
+
+    Skipped files get a one-line placeholder; pass a Counter as skipped to
+    tally them by reason. With a Deduplicator as dedup, a file identical to
+    an earlier one yields ("path (identical to other/path)", None) instead.
+    A Grep as grep cuts each content down to the lines around its matches
+    (if it has a context), and a Compactor as compact shrinks what is left.
+    """
+    for entry, rel_path, content, skip, first in _iter_processed(
+            root_dir, files, jobs, cache, max_file_size, skipped, dedup, compact, grep):
+        if skip:
+            yield rel_path, _skipped_text(entry, skip)
+        elif first is not None:
+            yield f"{rel_path} (identical to {first})", None
+        else:
+            yield rel_path, content
+
+
+def _skipped_text(entry, skip):
+    return f"[skipped: {skip}, {entry.size} bytes]"
+
+
+def _document_text(rel_path, content):
+    """Header and body of a document; a None body (a duplicate) is a header line only."""
+    if content is None:
+        return f"// {rel_path}", ""
+    return f"// {rel_path}\n\n", content
+
+
+def join_documents(documents, budget=None):
+    """Yield merged output chunks for (rel_path, content) documents."""
+    for i, (rel_path, content) in enumerate(documents):
+        header, content = _document_text(rel_path, content)
+        if i:
+            yield SEPARATOR
+            if budget is not None:
+                budget.add_overhead(SEPARATOR)
+        if budget is not None:
+            budget.add(rel_path, header, content)
+        yield header
+        yield content
+    yield "\n"
+
+
+def iter_merge(root_dir, files, jobs=1, cache=None, max_file_size=None, skipped=None,
+               budget=None, dedup=None, compact=None, grep=None):
+    """Yield merged output chunks one file at a time."""
+    documents = iter_documents(root_dir, files, jobs, cache, max_file_size, skipped, dedup,
+                               compact, grep)
+    yield from join_documents(documents, budget)
+
+
+def merge_files(root_dir, files, jobs=1, cache=None, max_file_size=None):
     """Merge file contents into AI-friendly text format."""
-    parts = []
-    for file_path in files:
-        rel_path = os.path.relpath(file_path, root_dir)
+    return "".join(iter_merge(root_dir, files, jobs, cache, max_file_size))
+
+
+def iter_output(root_dir, files, tree, jobs=1, cache=None, max_file_size=None, skipped=None,
+                budget=None, dedup=None, compact=None, grep=None):
+    """Yield the full output: tree, separator, then merged file chunks."""
+    if budget is not None:
+        budget.add_overhead(tree + TREE_SEPARATOR)
+    yield tree
+    yield TREE_SEPARATOR
+    yield from iter_merge(root_dir, files, jobs, cache, max_file_size, skipped, budget, dedup,
+                          compact, grep)
+
+
+def _mtime(entry):
+    """Modification time of a file on disk, or None for archive members and git blobs."""
+    if entry.loader is not None:
+        return None
+    try:
+        return entry.stat().st_mtime
+    except OSError:
+        return None
+
+
+def iter_jsonl(root_dir, files, jobs=1, cache=None, max_file_size=None, skipped=None,
+               budget=None, dedup=None, compact=None, grep=None):
+    """Yield the --format jsonl output: one JSON record per file and line, in order.
+
+    A record holds path ('/'-separated, relative to root_dir), size and
+    mtime of the file as stored, the encoding of content, and content. For
+    a skipped file content is null and "skipped" gives the reason; for a
+    duplicate (with dedup) content is null and "identical_to" names the
+    first copy. Read the records back with read_jsonl().
+    """
+    for entry, rel_path, content, skip, first in _iter_processed(
+            root_dir, files, jobs, cache, max_file_size, skipped, dedup, compact, grep):
+        record = {"path": rel_path.replace(os.sep, "/"), "size": entry.size,
+                  "mtime": _mtime(entry), "encoding": None if content is None else "utf-8",
+                  "content": content}
+        if skip:
+            record["skipped"] = skip
+        elif first is not None:
+            record["identical_to"] = first.replace(os.sep, "/")
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        if budget is not None:
+            budget.add(rel_path, line)
+        yield line
+
+
+def build_model(root_dir, extensions=None, ignore=True, git=False, rev=None,
+                max_file_size=None):
+    """Build the directory model from a walk, the git index, a revision or an archive."""
+    if os.path.isfile(root_dir):
+        if not is_archive(root_dir):
+            raise ValueError(f"'{root_dir}' is not a directory or archive")
+        if git or rev:
+            raise ValueError("--git and --rev need a directory, not an archive")
+        return scan_archive(root_dir, extensions, ignore, max_file_size)
+    if git or rev:
         try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-        except Exception as e:
-            content = f"Error reading file: {e}"
+            return scan_git(root_dir, extensions, rev, ignore)
+        except KeyError as e:
+            raise ValueError(f"git object {e.args[0]} not found") from None
+    return scan_dir(root_dir, extensions, ignore)
+
+
+def iter_files(root_dir, extensions=None, ignore=True, git=False, rev=None):
+    """Yield a FileEntry for every matched file under root_dir, in output order.
+
+    Public API; the filters mirror the CLI's extensions, --no-ignore, --git and --rev.
+    """
+    yield from build_model(root_dir, extensions, ignore, git, rev).iter_files()
+
+
+def iter_chunks(root_dir, files=None, extensions=None, ignore=True, git=False, rev=None,
+                tree=True, jobs=1, cache=None, max_file_size=None, skipped=None, budget=None,
+                dedup=None, compact=None, grep=None, format="text", progress=None):
+    """Yield the merged output for root_dir as text chunks, reading files lazily.
+
+    Public API. files, if given, is an iterable of paths or FileEntry objects
+    to merge in that order instead of walking root_dir; tree=False leaves out
+    the file tree header; a Deduplicator as dedup collapses identical files
+    and a Compactor as compact strips whitespace (and comments) from them.
+    A Grep as grep keeps only the files whose content matches it; the file
+    selection happens up front, before the first chunk. format="jsonl"
+    yields one JSON record per file instead (see iter_jsonl), without a tree.
+    progress(n), if given, is called as the n-th file's output is produced.
+    Feed the chunks to write() to encode (and compress) them to a sink.
+    """
+    if format not in OUTPUT_FORMATS:
+        raise ValueError(f"unknown format {format!r} (choose from {', '.join(OUTPUT_FORMATS)})")
+    if files is None:
+        model = build_model(root_dir, extensions, ignore, git, rev, max_file_size)
+        files = list(model.iter_files())
+        if grep is not None:
+            files = grep.filter(files, jobs, max_file_size)
+            _prune_model(model, set(map(id, files)))
+    else:
+        files = [_as_entry(f) for f in files]
+        if grep is not None:
+            files = grep.filter(files, jobs, max_file_size)
+        model = None
+        if tree and format != "jsonl":
+            rel_paths = [os.path.relpath(e.path, root_dir).replace(os.sep, "/") for e in files]
+            model = _model_listing(root_dir, rel_paths)
+    try:
+        if format == "jsonl":
+            records = iter_jsonl(root_dir, files, jobs, cache, max_file_size, skipped, budget,
+                                 dedup, compact, grep)
+            yield from records if progress is None else _counted(records, progress)
+            return
+        documents = iter_documents(root_dir, files, jobs, cache, max_file_size, skipped, dedup,
+                                   compact, grep)
+        if progress is not None:
+            documents = _counted(documents, progress)
+        if tree:
+            text = render_tree(model)
+            if budget is not None:
+                budget.add_overhead(text + TREE_SEPARATOR)
+            yield text
+            yield TREE_SEPARATOR
+        yield from join_documents(documents, budget)
+    finally:
+        if model is not None:
+            model.close()
+
+
+def _counted(items, progress):
+    """Yield items, calling progress with the running count before each."""
+    for n, item in enumerate(items, 1):
+        progress(n)
+        yield item
+
+
+def estimate_tokens(text):
+    """Cheap offline token estimate: about CHARS_PER_TOKEN characters per token."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class TokenBudget:
+    """Running per-file token estimates, checked against an optional limit."""
+
+    def __init__(self, max_tokens=None):
+        self.max_tokens = max_tokens
+        self.total = 0
+        self.files = []
+
+    def add(self, rel_path, *texts):
+        """Count a file's output text and return its token estimate."""
+        tokens = sum(estimate_tokens(text) for text in texts)
+        self.files.append((rel_path, tokens))
+        self.total += tokens
+        return tokens
 
-        parts.append(f"// {rel_path}\n\n{content}")
+    def add_overhead(self, text):
+        """Count text that belongs to no file, such as the tree and separators."""
+        tokens = estimate_tokens(text)
+        self.total += tokens
+        return tokens
 
-    return ("\n\n" + "-" * 40 + "\n\n").join(parts) + "\n"
+    @property
+    def exceeded(self):
+        return self.max_tokens is not None and self.total > self.max_tokens
+
+    def report(self, limit=10):
+        """Return report lines listing the largest files, biggest first."""
+        largest = sorted(self.files, key=lambda item: item[1], reverse=True)
+        lines = []
+        if self.exceeded:
+            excess = self.total - self.max_tokens
+            dropped = 0
+            for n, (_, tokens) in enumerate(largest, 1):
+                dropped += tokens
+                if dropped >= excess:
+                    lines.append(f"over by ~{excess} tokens; dropping the {n} largest "
+                                 f"file{'s' if n > 1 else ''} below would fit")
+                    break
+        lines.append(f"{'tokens':>9}  {'share':>6}  file")
+        for rel_path, tokens in largest[:limit]:
+            share = tokens * 100 / self.total if self.total else 0
+            lines.append(f"{tokens:>9}  {share:>5.1f}%  {rel_path}")
+        return lines
+
+
+def write_parts(output, tree, documents, budget):
+    """Write documents into numbered files of at most budget.max_tokens each.
+
+    The tree goes at the top of the first part. A file that alone exceeds
+    the budget gets a part of its own. Returns the list of part paths.
+    """
+    stem, ext = os.path.splitext(output)
+    paths = []
+
+    def _next_part():
+        paths.append(f"{stem}.{len(paths) + 1:03d}{ext}")
+        return open(paths[-1], "w", encoding="utf-8")
+
+    f = _next_part()
+    try:
+        f.write(tree)
+        f.write(TREE_SEPARATOR)
+        used = budget.add_overhead(tree + TREE_SEPARATOR)
+        sep_tokens = estimate_tokens(SEPARATOR)
+        first = True
+        for rel_path, content in documents:
+            header, content = _document_text(rel_path, content)
+            tokens = budget.add(rel_path, header, content)
+            if not first and used + sep_tokens + tokens > budget.max_tokens:
+                f.write("\n")
+                f.close()
+                f = _next_part()
+                used, first = 0, True
+            if not first:
+                # Only a separator that is written counts; a new part starts without one
+                f.write(SEPARATOR)
+                used += budget.add_overhead(SEPARATOR)
+            f.write(header)
+            f.write(content)
+            used += tokens
+            first = False
+        f.write("\n")
+    finally:
+        f.close()
+
+    # Drop parts left over from an earlier, longer run, gaps and all
+    folder, name = os.path.split(stem)
+    part = re.compile(re.escape(name) + r"\.(\d{3,})" + re.escape(ext))
+    for entry in os.listdir(folder or "."):
+        match = part.fullmatch(entry)
+        if match and int(match.group(1)) > len(paths):
+            os.remove(os.path.join(folder, entry))
+    return paths
+
+
+def write_chunks(chunks, stream):
+    """Write chunks to a text stream as they are produced."""
+    if _stats is not None:
+        for chunk in chunks:
+            start = time.perf_counter()
+            stream.write(chunk)
+            _stats.add("write", time.perf_counter() - start)
+            _stats.bytes_out += len(chunk.encode("utf-8", "surrogatepass"))
+        return
+    for chunk in chunks:
+        stream.write(chunk)
+
+
+class _CountingSink:
+    """Pass writes through to a binary sink, counting the bytes."""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.nbytes = 0
+
+    def write(self, data):
+        self.nbytes += len(data)
+        return self.sink.write(data)
+
+    def flush(self):
+        if hasattr(self.sink, "flush"):
+            self.sink.flush()
+
+
+def _compressor(sink, compress):
+    """A binary file object that compresses what is written to it onto sink."""
+    if compress == "gzip":
+        import gzip
+        return gzip.GzipFile(fileobj=sink, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+    if compress == "xz":
+        import lzma
+        return lzma.LZMAFile(sink, "wb")
+    raise ValueError(f"unknown compression {compress!r} (choose from {', '.join(COMPRESSIONS)})")
+
+
+def write(chunks, sink, encoding="utf-8", compress=None):
+    """Encode text chunks incrementally onto a binary sink; return bytes written.
+
+    sink is anything with a write(bytes) method (file, socket file, BytesIO,
+    pipe) or a path to create. With compress ("gzip" or "xz") the bytes are
+    compressed on the way, and the count is of compressed bytes.
+    """
+    if isinstance(sink, (str, bytes, os.PathLike)):
+        with open(sink, "wb") as f:
+            return write(chunks, f, encoding, compress)
+    if compress is not None:
+        counted = _CountingSink(sink)
+        with _compressor(counted, compress) as stream:
+            write(chunks, stream, encoding)
+        return counted.nbytes
+    encoder = codecs.getincrementalencoder(encoding)()
+    nbytes = 0
+    for chunk in chunks:
+        data = encoder.encode(chunk)
+        if _stats is not None:
+            start = time.perf_counter()
+            sink.write(data)
+            _stats.add("write", time.perf_counter() - start)
+        else:
+            sink.write(data)
+        nbytes += len(data)
+    data = encoder.encode("", final=True)
+    if data:
+        sink.write(data)
+        nbytes += len(data)
+    if _stats is not None:
+        _stats.bytes_out += nbytes
+    return nbytes
+
+
+def read_jsonl(source):
+    """Lazily yield the records of a --format jsonl output as dicts.
+
+    Public API. source is a path or a binary file object that can peek() or
+    seek(); gzip and xz compression are recognised from the first bytes.
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, "rb") as f:
+            yield from read_jsonl(f)
+        return
+    if hasattr(source, "peek"):
+        head = source.peek(6)[:6]
+    else:
+        head = source.read(6)
+        source.seek(-len(head), io.SEEK_CUR)
+    if head.startswith(b"\x1f\x8b"):
+        import gzip
+        source = gzip.GzipFile(fileobj=source, mode="rb")
+    elif head.startswith(b"\xfd7zXZ\0"):
+        import lzma
+        source = lzma.LZMAFile(source, "rb")
+    for line in source:  # no UTF-8 sequence holds a b"\n" byte, and json.loads takes bytes
+        if line.strip():
+            yield json.loads(line)
+
+
+def _copy_to_clipboard(chunks):
+    """Stream chunks into the first available clipboard tool."""
+    import subprocess
+    for cmd in (["pbcopy"], ["xclip", "-selection", "clipboard"]):
+        try:
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        except FileNotFoundError:
+            continue
+        write(chunks, proc.stdin)
+        proc.stdin.close()
+        proc.wait()
+        return True
+    return False
 
 
 def parse_extensions(ext_args):
@@ -108,67 +2465,666 @@ def parse_extensions(ext_args):
     return exts
 
 
+def parse_size(text):
+    """Parse a byte size such as 500000, 200K, 1.5M or 2G."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper().rstrip("B")
+    try:
+        if text and text[-1] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+
+
+def parse_count(text):
+    """Parse a count of threads or processes, 1 or more."""
+    try:
+        count = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid count: {text!r}")
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"count must be at least 1: {text!r}")
+    return count
+
+
+def write_output(output, args, n_files):
+    """Send output chunks to the file, clipboard or stdout chosen in args."""
+    if args.output:
+        write(output, args.output, compress=args.compress)
+        print(f"rtt: written to {args.output} ({n_files} files)")
+    elif args.compress:
+        sys.stdout.flush()
+        write(output, sys.stdout.buffer, compress=args.compress)
+        sys.stdout.buffer.flush()
+    elif args.copy:
+        if _copy_to_clipboard(output):
+            print(f"rtt: copied to clipboard ({n_files} files)")
+        else:
+            print("rtt: clipboard not available, printing to stdout", file=sys.stderr)
+            write_chunks(output, sys.stdout)
+            sys.stdout.write("\n")
+    else:
+        write_chunks(output, sys.stdout)
+        if args.format != "jsonl":
+            sys.stdout.write("\n")
+
+
+def merge_project(root_dir, output, extensions=None, ignore=True, git=False, rev=None,
+                  jobs=1, max_file_size=None, cache_dir=None, use_cache=False, dedup=False,
+                  compact=None, grep=None, context=None, format="text", compress=None):
+    """Merge one project into output; return (files, bytes written, seconds).
+
+    This is the unit of work of --batch and runs in a worker process.
+    """
+    start = time.perf_counter()
+    model = build_model(root_dir, extensions, ignore, git, rev, max_file_size)
+    cache = None
+    try:
+        files = list(model.iter_files())
+        grep = Grep(grep, context) if grep is not None else None
+        if grep is not None:
+            files = grep.filter(files, jobs, max_file_size)
+            _prune_model(model, set(map(id, files)))
+        if not files:
+            raise ValueError("no files found matching criteria")
+        use_cache = use_cache and not rev and not os.path.isfile(root_dir)
+        cache = ContentCache(root_dir, cache_dir) if use_cache else None
+        dedup = Deduplicator() if dedup else None
+        compact = Compactor(compact) if compact else None
+        if format == "jsonl":
+            chunks = iter_jsonl(root_dir, files, jobs, cache, max_file_size, dedup=dedup,
+                                compact=compact, grep=grep)
+        else:
+            chunks = iter_output(root_dir, files, render_tree(model), jobs, cache, max_file_size,
+                                 dedup=dedup, compact=compact, grep=grep)
+        nbytes = write(chunks, output, compress=compress)
+    finally:
+        if cache is not None:
+            cache.close()
+        model.close()
+    return len(files), nbytes, time.perf_counter() - start
+
+
+def read_manifest(path):
+    """Project directories listed one per line; '#' starts a comment.
+
+    Relative entries are resolved against the manifest's directory.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    projects = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                projects.append(os.path.join(base, os.path.expanduser(line)))
+    return projects
+
+
+def _format_size(n):
+    for unit in ("B", "KiB", "MiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GiB"
+
+
+def run_batch(projects, out_dir, extensions, args):
+    """Merge several projects in parallel processes into out_dir and print a summary.
+
+    A failing project is reported in the summary without stopping the others.
+    Return the number of failures.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    os.makedirs(out_dir, exist_ok=True)
+    suffix = (".jsonl" if args.format == "jsonl" else ".txt") + \
+        {"gzip": ".gz", "xz": ".xz"}.get(args.compress, "")
+    outputs = []
+    used = set()
+    for root_dir in projects:
+        name = os.path.basename(os.path.normpath(root_dir)) or "root"
+        stem, n = name, 2
+        while stem in used:
+            stem, n = f"{name}-{n}", n + 1
+        used.add(stem)
+        outputs.append(os.path.join(out_dir, stem + suffix))
+
+    start = time.perf_counter()
+    results = {}
+    with ProcessPoolExecutor(max_workers=args.processes) as pool:
+        futures = {}
+        for root_dir, output in zip(projects, outputs):
+            if not (os.path.isdir(root_dir) or is_archive(root_dir)):
+                results[root_dir] = NotADirectoryError(f"'{root_dir}' is not a directory or archive")
+                continue
+            futures[root_dir] = pool.submit(
+                merge_project, root_dir, output, extensions, not args.no_ignore, args.git,
+                args.rev, args.jobs, args.max_file_size, args.cache_dir,
+                args.cache and not args.no_cache,
+                args.dedup, args.compact, args.grep, args.context, args.format, args.compress)
+        for root_dir, future in futures.items():
+            try:
+                results[root_dir] = future.result()
+            except Exception as e:
+                results[root_dir] = e
+    elapsed = time.perf_counter() - start
+
+    labels = [os.path.basename(o)[:-len(suffix)] for o in outputs]
+    width = max(len("project"), *map(len, labels))
+    print(f"{'project':<{width}}  {'files':>7}  {'bytes':>10}  {'elapsed':>8}")
+    total_files = total_bytes = failed = 0
+    for root_dir, label in zip(projects, labels):
+        result = results[root_dir]
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{label:<{width}}  error: {result}")
+            continue
+        n_files, nbytes, seconds = result
+        total_files += n_files
+        total_bytes += nbytes
+        print(f"{label:<{width}}  {n_files:>7}  {_format_size(nbytes):>10}  {seconds:>7.2f}s")
+    print(f"{'total':<{width}}  {total_files:>7}  {_format_size(total_bytes):>10}  {elapsed:>7.2f}s"
+          + (f"  ({failed} failed)" if failed else ""))
+    return failed
+
+
+def write_atomic(path, text):
+    """Replace path with text in one rename, so readers never see a partial file."""
+    import tempfile
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp",
+                               dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class _Inotify:
+    """Minimal inotify binding over ctypes; raises OSError where unavailable."""
+
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED = 0x400, 0x800, 0x4000, 0x8000
+    CONTENT = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+    STRUCTURE = (IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                 | IN_DELETE_SELF | IN_MOVE_SELF)
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is Linux-only")
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        try:
+            self._add_watch = libc.inotify_add_watch
+        except AttributeError:
+            raise OSError("libc has no inotify")
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._errno = ctypes.get_errno
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(self._errno(), "inotify_init1 failed")
+        self.dirs = {}  # watch descriptor -> directory path
+        self.watched = set()
+
+    def add(self, path):
+        """Watch a directory; raise OSError e.g. when the watch limit is reached."""
+        if path in self.watched:
+            return
+        wd = self._add_watch(self.fd, os.fsencode(path), self.CONTENT | self.STRUCTURE)
+        if wd < 0:
+            err = self._errno()
+            if err == errno.ENOENT:
+                return  # Removed since the walk; the rescan will notice
+            raise OSError(err, os.strerror(err), path)
+        self.dirs[wd] = path
+        self.watched.add(path)
+
+    def read(self, timeout=None):
+        """Return [(dir_path, name, mask), ...], or None if nothing arrives within timeout."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return None
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, length = struct.unpack_from("iIII", data, pos)
+            pos += 16
+            name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+            pos += length
+            path = self.dirs.get(wd)
+            if mask & self.IN_IGNORED:
+                self.watched.discard(self.dirs.pop(wd, None))
+            events.append((path, name, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Keep a merged output file up to date as the project changes.
+
+    Contents stay in memory, keyed by (mtime_ns, size), so each update only
+    re-reads files that changed. The tree is re-walked when files or
+    directories come and go; plain edits only re-stat the edited files.
+    With dedup, identical files are collapsed afresh on every rewrite.
+    """
+
+    def __init__(self, root_dir, output, extensions=None, ignore=True, jobs=1,
+                 max_file_size=None, poll=None, compact=None, dedup=False):
+        self.root_dir = root_dir
+        self.output = os.path.abspath(output)
+        self.extensions = extensions
+        self.ignore = ignore
+        self.jobs = jobs
+        self.max_file_size = max_file_size
+        self.poll = poll
+        self.compact = Compactor(compact) if compact else None
+        self.dedup = dedup
+        self.tree = ""
+        self.files = []
+        self.docs = {}  # path -> ((mtime_ns, size), rel_path, content, skipped)
+        self.last = None
+        try:
+            with open(self.output, encoding="utf-8") as f:
+                self.last = f.read()
+        except (OSError, UnicodeDecodeError):
+            pass
+        self.notifier = None
+        if poll is None:
+            try:
+                self.notifier = _Inotify()
+            except OSError:
+                self.poll = WATCH_POLL_INTERVAL
+
+    @staticmethod
+    def _key(entry):
+        st = entry.stat()
+        return st.st_mtime_ns, st.st_size
+
+    def rescan(self):
+        """Walk the tree again; return the entries that are new or changed."""
+        visited = []
+        model = scan_dir(self.root_dir, self.extensions, self.ignore, visited)
+        self.tree = render_tree(model)
+        self.files = [e for e in model.iter_files() if e.path != self.output]
+        if self.notifier is not None:
+            try:
+                for path in visited:
+                    self.notifier.add(path)
+            except OSError as e:
+                print(f"rtt: warning: inotify unavailable ({e}), polling instead",
+                      file=sys.stderr)
+                self.notifier.close()
+                self.notifier = None
+                self.poll = WATCH_POLL_INTERVAL
+        present = {e.path for e in self.files}
+        for path in [p for p in self.docs if p not in present]:
+            del self.docs[path]
+        return [e for e in self.files if self._changed(e)]
+
+    def _changed(self, entry):
+        try:
+            return self.docs.get(entry.path, (None,))[0] != self._key(entry)
+        except OSError:
+            return entry.path not in self.docs  # e.g. a dangling symlink
+
+    def update(self, rescan=True, dirty=()):
+        """Re-read what changed and rewrite the output if it differs.
+
+        Return (files re-read, whether the output was written).
+        """
+        if rescan:
+            changed = self.rescan()
+        else:
+            dirty = set(dirty)
+            changed = [FileEntry(e.name, e.path) for e in self.files if e.path in dirty]
+            changed = [e for e in changed if self._changed(e)]
+        for entry, rel_path, content, skip, _ in _iter_processed(
+                self.root_dir, changed, self.jobs, max_file_size=self.max_file_size,
+                compact=self.compact):
+            try:
+                key = self._key(entry)
+            except OSError:
+                key = None
+            if skip:
+                content = _skipped_text(entry, skip)
+            self.docs[entry.path] = (key, rel_path, content, bool(skip))
+
+        text = self.tree + TREE_SEPARATOR + "".join(join_documents(self._documents()))
+        if text == self.last:
+            return len(changed), False
+        write_atomic(self.output, text)
+        self.last = text
+        return len(changed), True
+
+    def _documents(self):
+        dedup = Deduplicator() if self.dedup else None
+        for entry in self.files:
+            if entry.path not in self.docs:
+                continue
+            _, rel_path, content, skipped = self.docs[entry.path]
+            if dedup is not None and not skipped:
+                first = dedup.check(rel_path, content)
+                if first is not None:
+                    yield f"{rel_path} (identical to {first})", None
+                    continue
+            yield rel_path, content
+
+    def wait(self):
+        """Block until something changed; return (rescan, dirty_paths)."""
+        if self.notifier is None:
+            time.sleep(self.poll)
+            return True, ()
+        events = self.notifier.read()
+        # Debounce: an editor save or a checkout arrives as a burst of events
+        while True:
+            more = self.notifier.read(WATCH_DEBOUNCE)
+            if more is None:
+                break
+            events += more
+        rescan = False
+        dirty = set()
+        for dir_path, name, mask in events:
+            if mask & _Inotify.IN_Q_OVERFLOW or dir_path is None:
+                rescan = True
+                continue
+            path = os.path.join(dir_path, name) if name else dir_path
+            if path == self.output or (name.startswith('.') and name not in IGNORE_FILES):
+                continue
+            if name in IGNORE_FILES or mask & _Inotify.STRUCTURE:
+                rescan = True
+            elif mask & _Inotify.CONTENT:
+                dirty.add(path)
+        return rescan, dirty
+
+    def run(self):
+        self.update()
+        print(f"rtt: watching {self.root_dir} ({len(self.files)} files, "
+              f"{'inotify' if self.notifier else f'polling every {self.poll}s'}), "
+              f"writing {self.output}", file=sys.stderr)
+        while True:
+            rescan, dirty = self.wait()
+            if not rescan and not dirty:
+                continue
+            n, written = self.update(rescan, dirty)
+            if written:
+                print(f"rtt: {time.strftime('%H:%M:%S')} updated {self.output} "
+                      f"({len(self.files)} files, {n} re-read)", file=sys.stderr)
+
+    def close(self):
+        if self.notifier is not None:
+            self.notifier.close()
+
+
 def main():
     parser = argparse.ArgumentParser(
         prog="rtt",
         description="Repo to Text — convert repository code to AI-friendly text.",
     )
-    parser.add_argument("path", help="Path to the project directory")
+    parser.add_argument("path", nargs="?",
+                        help="Path to the project directory, or a .zip / .tar(.gz) snapshot of it")
     parser.add_argument("extensions", nargs="*",
-                        help="File extensions to include (e.g. .py .swift .js). All files if omitted.")
+                        help="File extensions to include (e.g. .py .swift .js). All files if omitted. "
+                             "With --out-dir, leading arguments that are directories are projects.")
     parser.add_argument("-o", "--output", metavar="FILE",
                         help="Write output to a file instead of stdout")
     parser.add_argument("--tree", action="store_true",
                         help="Print the file tree only, without content")
     parser.add_argument("--copy", "-c", action="store_true",
                         help="Copy output to clipboard (macOS/Linux)")
+    parser.add_argument("--git", action="store_true",
+                        help="List files from the git index instead of walking the directory")
+    parser.add_argument("--rev", metavar="REV",
+                        help="With --git, dump files as of REV straight from the object store")
+    parser.add_argument("--no-ignore", action="store_true",
+                        help="Don't apply .gitignore / .rttignore rules")
+    parser.add_argument("-j", "--jobs", type=parse_count, default=DEFAULT_JOBS, metavar="N",
+                        help="Read files ahead with N threads, useful on network or cold disks "
+                             f"(default: {DEFAULT_JOBS})")
+    parser.add_argument("--max-file-size", type=parse_size, metavar="SIZE",
+                        help="Skip files larger than SIZE (e.g. 500K, 2M)")
+    parser.add_argument("--max-tokens", type=int, metavar="N",
+                        help="Warn, with a per-file report, if the output exceeds ~N tokens")
+    parser.add_argument("--chunk", action="store_true",
+                        help="With --max-tokens and -o, split output into numbered files "
+                             "of at most N tokens each")
+    parser.add_argument("--cache", action="store_true",
+                        help="Serve unchanged files from an on-disk content cache; only pays "
+                             "off where reading is slow, e.g. on network disks")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Don't use the content cache, even with --cache (the default)")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help=f"Content cache location (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Write each distinct file content once; later copies become "
+                             "'// path (identical to other/path)'")
+    parser.add_argument("--compact", nargs="?", const="light", choices=COMPACT_LEVELS,
+                        help="Trim trailing whitespace and blank-line runs (light, the default); "
+                             "aggressive also strips comments and Python docstrings")
+    parser.add_argument("--grep", metavar="REGEX",
+                        help="Only merge files whose content matches REGEX (^ and $ match at "
+                             "line boundaries)")
+    parser.add_argument("-C", "--context", type=int, metavar="N",
+                        help="With --grep, keep only the N lines around each match "
+                             "instead of whole files")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text",
+                        help="text (the default): tree, then '// path' sections; jsonl: one "
+                             "JSON record per file with path, size, mtime, encoding and content")
+    parser.add_argument("--compress", choices=COMPRESSIONS,
+                        help="Compress the output as it is written (to -o, --out-dir or stdout)")
+    parser.add_argument("--watch", action="store_true",
+                        help="With -o, keep rewriting the output as files change (Ctrl-C to stop)")
+    parser.add_argument("--poll", type=float, metavar="SECONDS",
+                        help="With --watch, poll every SECONDS instead of using inotify")
+    parser.add_argument("--batch", metavar="MANIFEST",
+                        help="Merge every project listed in MANIFEST (one path per line) "
+                             "into --out-dir")
+    parser.add_argument("--out-dir", metavar="DIR",
+                        help="With --batch or several project paths, write <project>.txt files here")
+    parser.add_argument("--processes", type=parse_count, metavar="N",
+                        help="Projects merged in parallel by --batch (default: CPU count)")
+    parser.add_argument("--stats", action="store_const", const="text",
+                        help="Report per-phase timings and I/O counters on stderr")
+    parser.add_argument("--stats-json", dest="stats", action="store_const", const="json",
+                        help="Like --stats, as one JSON object")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write a cProfile dump of the run to FILE")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Report cache statistics and token estimates on stderr")
+
+    args = parser.parse_intermixed_args()
+    stats = enable_stats() if args.stats else None
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        _run(parser, args, stats)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            print(f"rtt: profile written to {args.profile} "
+                  f"(inspect with: python -m pstats {args.profile})", file=sys.stderr)
+        if stats is not None:
+            if args.stats == "json":
+                print(json.dumps(stats.as_dict()), file=sys.stderr)
+            else:
+                for line in stats.report():
+                    print(f"rtt: {line}", file=sys.stderr)
 
-    args = parser.parse_args()
+
+def _run(parser, args, stats=None):
+    """Everything main() does after parsing arguments."""
+    timed = stats.phase if stats is not None else (lambda name: nullcontext())
+
+    if args.context is not None and (args.grep is None or args.context < 0):
+        parser.error("--context needs --grep and a count of 0 or more")
+    grep = None
+    if args.grep is not None:
+        try:
+            grep = Grep(args.grep, args.context)
+        except re.error as e:
+            parser.error(f"invalid --grep pattern: {e}")
+
+    # Several projects: leading positionals that are directories or archives, then extensions
+    projects = []
+    if args.batch or args.out_dir:
+        positionals = ([args.path] if args.path else []) + args.extensions
+        while positionals and (os.path.isdir(positionals[0]) or is_archive(positionals[0])):
+            projects.append(os.path.abspath(positionals.pop(0)))
+        args.extensions = positionals
+        if args.batch:
+            try:
+                projects += read_manifest(args.batch)
+            except OSError as e:
+                parser.error(f"can't read manifest: {e}")
+        if not args.out_dir:
+            parser.error("--batch requires --out-dir")
+        if not projects:
+            parser.error("no project directories given")
+        if args.output or args.tree or args.copy or args.chunk or args.watch:
+            parser.error("--out-dir can't be combined with -o, --tree, --copy, --chunk or --watch")
+        extensions = parse_extensions(args.extensions) if args.extensions else None
+        sys.exit(1 if run_batch(projects, args.out_dir, extensions, args) else 0)
+    if args.path is None:
+        parser.error("the following arguments are required: path")
+
+    if args.chunk and not (args.max_tokens and args.output):
+        parser.error("--chunk requires --max-tokens and -o")
+    if (args.format == "jsonl" or args.compress) and (args.tree or args.chunk or args.watch
+                                                      or args.copy):
+        parser.error("--format jsonl and --compress can't be combined with --tree, --chunk, "
+                     "--watch or --copy")
+    if args.watch and not args.output:
+        parser.error("--watch requires -o")
+    if args.watch and (args.git or args.rev or args.chunk or args.tree or args.copy or grep):
+        parser.error("--watch can't be combined with --git, --rev, --chunk, --tree, --copy "
+                     "or --grep")
 
     root_dir = os.path.abspath(args.path)
-    if not os.path.isdir(root_dir):
-        print(f"rtt: error: '{args.path}' is not a directory", file=sys.stderr)
+    archive = os.path.isfile(root_dir)
+    if not (archive or os.path.isdir(root_dir)):
+        print(f"rtt: error: '{args.path}' is not a directory or archive", file=sys.stderr)
         sys.exit(1)
+    if archive and args.watch:
+        parser.error("--watch needs a directory, not an archive")
 
     extensions = parse_extensions(args.extensions) if args.extensions else None
 
+    if args.watch:
+        watcher = Watcher(root_dir, args.output, extensions, not args.no_ignore, args.jobs,
+                          args.max_file_size, args.poll, args.compact, args.dedup)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            print("rtt: stopped watching", file=sys.stderr)
+        finally:
+            watcher.close()
+        return
+
+    # One walk (or git index read) feeds both the tree and the merge
+    try:
+        with timed("walk"):
+            model = build_model(root_dir, extensions, not args.no_ignore, args.git, args.rev,
+                                args.max_file_size)
+    except (OSError, ValueError) as e:
+        print(f"rtt: error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if grep is not None:
+        with timed("grep"):
+            candidates = list(model.iter_files())
+            matched = grep.filter(candidates, args.jobs, args.max_file_size)
+            _prune_model(model, set(map(id, matched)))
+        print(f"rtt: grep: {len(matched)} of {len(candidates)} files match", file=sys.stderr)
+
     # Tree-only mode
     if args.tree:
-        tree = build_tree(root_dir, extensions)
+        with timed("tree"):
+            tree = render_tree(model)
+        model.close()
         print(tree)
         return
 
-    files = collect_files(root_dir, extensions)
+    files = list(model.iter_files())
     if not files:
+        model.close()
         print("rtt: no files found matching criteria.", file=sys.stderr)
         sys.exit(1)
 
-    # Build output: tree + merged content
-    tree = build_tree(root_dir, extensions)
-    merged = merge_files(root_dir, files)
-    output = f"{tree}\n\n{'=' * 40}\n\n{merged}"
-
-    # Output destination
-    if args.output:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(output)
-        print(f"rtt: written to {args.output} ({len(files)} files)")
-    elif args.copy:
+    cache = None
+    if args.cache and not args.no_cache and not args.rev and not archive:
         try:
-            import subprocess
-            proc = subprocess.Popen(["pbcopy"], stdin=subprocess.PIPE)
-            proc.communicate(output.encode("utf-8"))
-            print(f"rtt: copied to clipboard ({len(files)} files)")
-        except FileNotFoundError:
-            try:
-                proc = subprocess.Popen(["xclip", "-selection", "clipboard"], stdin=subprocess.PIPE)
-                proc.communicate(output.encode("utf-8"))
-                print(f"rtt: copied to clipboard ({len(files)} files)")
-            except FileNotFoundError:
-                print("rtt: clipboard not available, printing to stdout", file=sys.stderr)
-                print(output)
-    else:
-        print(output)
+            cache = ContentCache(root_dir, args.cache_dir)
+        except Exception as e:
+            print(f"rtt: warning: cache disabled: {e}", file=sys.stderr)
+
+    try:
+        # Build output lazily: tree first, then each file as it is read
+        with timed("tree"):
+            tree = render_tree(model)
+        skipped = Counter()
+        budget = TokenBudget(args.max_tokens)
+        dedup = Deduplicator() if args.dedup else None
+        compact = Compactor(args.compact) if args.compact else None
+        if args.chunk:
+            documents = iter_documents(root_dir, files, args.jobs, cache, args.max_file_size,
+                                       skipped, dedup, compact, grep)
+            with timed("merge"):
+                parts = write_parts(args.output, tree, documents, budget)
+            if stats is not None:
+                stats.bytes_out += sum(os.path.getsize(p) for p in parts)
+            where = parts[0]
+            if len(parts) > 1:
+                where = f"{len(parts)} parts ({parts[0]} ... {parts[-1]})"
+            print(f"rtt: written to {where}, {len(files)} file{'s' if len(files) != 1 else ''}")
+            oversized = [(p, t) for p, t in budget.files if t > args.max_tokens]
+            for rel_path, tokens in oversized:
+                print(f"rtt: warning: {rel_path} alone is ~{tokens} tokens, over --max-tokens",
+                      file=sys.stderr)
+        else:
+            if args.format == "jsonl":
+                output = iter_jsonl(root_dir, files, args.jobs, cache, args.max_file_size,
+                                    skipped, budget, dedup, compact, grep)
+            else:
+                output = iter_output(root_dir, files, tree, args.jobs, cache, args.max_file_size,
+                                     skipped, budget, dedup, compact, grep)
+            # Reads, decoding and writes interleave here; their own totals are listed apart
+            with timed("merge"):
+                write_output(output, args, len(files))
+            if budget.exceeded:
+                print(f"rtt: warning: output is ~{budget.total} tokens, over the "
+                      f"--max-tokens budget of {args.max_tokens}", file=sys.stderr)
+                for line in budget.report():
+                    print(f"rtt:   {line}", file=sys.stderr)
+        if args.verbose:
+            print(f"rtt: ~{budget.total} tokens (estimated)", file=sys.stderr)
+        if dedup is not None and dedup.duplicates:
+            print(f"rtt: dedup: {dedup.duplicates} identical files referenced, "
+                  f"{dedup.bytes_saved} bytes saved", file=sys.stderr)
+        if compact is not None:
+            print(f"rtt: compact ({compact.level}): {compact.bytes_saved} of {compact.bytes_in} "
+                  f"bytes saved, ~{compact.tokens_saved} tokens", file=sys.stderr)
+        if skipped:
+            reasons = ", ".join(f"{reason}: {n}" for reason, n in sorted(skipped.items()))
+            print(f"rtt: skipped {sum(skipped.values())} files ({reasons})", file=sys.stderr)
+    finally:
+        model.close()
+        if cache is not None:
+            cache.close()
+            if stats is not None:
+                stats.cache_hits, stats.cache_misses = cache.hits, cache.misses
+            if args.verbose:
+                print(f"rtt: cache: {cache.hits} hits, {cache.misses} misses ({cache.path})",
+                      file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -10,5 +10,5 @@ setup(
             "rtt=rtt:main",
         ],
     },
-    python_requires=">=3.6",
+    python_requires=">=3.7",
 )
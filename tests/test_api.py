@@ -0,0 +1,24 @@
+import rtt
+
+
+def test_iter_chunks_tree_lists_every_given_file(tmp_path):
+    (tmp_path / "node_modules" / "pkg").mkdir(parents=True)
+    (tmp_path / "node_modules" / "pkg" / "index.js").write_text("x\n")
+    (tmp_path / ".env").write_text("y\n")
+    (tmp_path / "a.py").write_text("z\n")
+    files = [str(tmp_path / p) for p in ("a.py", ".env", "node_modules/pkg/index.js")]
+    out = "".join(rtt.iter_chunks(str(tmp_path), files=files))
+    tree = out.split(rtt.TREE_SEPARATOR)[0]
+    for name in ("a.py", ".env", "node_modules/", "pkg/", "index.js"):
+        assert name in tree
+    assert "// node_modules/pkg/index.js" in out
+
+
+def test_write_parts_removes_every_stale_part(tmp_path):
+    for n in (1, 2, 3, 5, 1000):
+        (tmp_path / f"out.{n:03d}.txt").write_text("old\n")
+    (tmp_path / "out.12.txt").write_text("not a part\n")
+    parts = rtt.write_parts(str(tmp_path / "out.txt"), "tree\n", [("a.py", "x\n")],
+                            rtt.TokenBudget(1000))
+    assert parts == [str(tmp_path / "out.001.txt")]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["out.001.txt", "out.12.txt"]
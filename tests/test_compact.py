@@ -0,0 +1,63 @@
+import rtt
+
+
+def test_go_raw_string_backslash_is_not_an_escape():
+    src = ("func f(p string) string {\n"
+           "\treturn strings.TrimSuffix(p, `\\`) // drop it\n"
+           "}\n"
+           "\n"
+           "const u = `see http://example.com/x`\n")
+    out = rtt.Compactor("aggressive").compact("p/f.go", src)
+    assert "// drop it" not in out
+    assert "const u = `see http://example.com/x`\n" in out
+
+
+def test_js_template_literal_keeps_escapes():
+    src = "const s = `a \\` // not a comment`;\n// gone\nf();\n"
+    out = rtt.Compactor("aggressive").compact("a.js", src)
+    assert out == "const s = `a \\` // not a comment`;\nf();\n"
+
+
+def test_squeeze_leaves_multiline_strings_alone():
+    src = 's = """a  \n\n\n\nb"""   \n\n\n\nx = 1  \n'
+    for level in ("light", "aggressive"):
+        out = rtt.Compactor(level).compact("m.py", src)
+        assert out == 's = """a  \n\n\n\nb"""\n\nx = 1\n'
+    template = "const t = `a  \n\n\n\nb`;\n"
+    assert rtt.Compactor("light").compact("t.js", template) == template
+
+
+def test_squeeze_outside_sources_is_line_based():
+    assert rtt.Compactor("light").compact("notes.txt", "\n\na  \n\n\n\nb \n") == "a\n\nb\n"
+
+
+def test_aggressive_keeps_shebang_and_coding_line():
+    src = "#!/usr/bin/env python3\n# -*- coding: latin-1 -*-\n# gone\nx = 1  # gone too\n"
+    out = rtt.Compactor("aggressive").compact("s.py", src)
+    assert out == "#!/usr/bin/env python3\n# -*- coding: latin-1 -*-\nx = 1\n"
+
+
+def test_aggressive_keeps_go_directives_and_cgo_preamble():
+    src = ("// Copyright notice\n"
+           "//go:build linux\n"
+           "// +build linux\n"
+           "\n"
+           "package p\n"
+           "\n"
+           "/*\n#include <stdio.h>\n*/\n"
+           'import "C"\n'
+           "\n"
+           "// Foo does.\n"
+           "//go:noinline\n"
+           "func Foo() {} // trailing\n")
+    out = rtt.Compactor("aggressive").compact("p.go", src)
+    assert out == ("//go:build linux\n"
+                   "// +build linux\n"
+                   "\n"
+                   "package p\n"
+                   "\n"
+                   "/*\n#include <stdio.h>\n*/\n"
+                   'import "C"\n'
+                   "\n"
+                   "//go:noinline\n"
+                   "func Foo() {}\n")
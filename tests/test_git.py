@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+
+import pytest
+
+import rtt
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+GIT_ENV = dict(os.environ, GIT_AUTHOR_NAME="t", GIT_AUTHOR_EMAIL="t@example.com",
+               GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@example.com",
+               GIT_CONFIG_NOSYSTEM="1", GIT_CONFIG_GLOBAL=os.devnull)
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], env=GIT_ENV, check=True,
+                          capture_output=True).stdout
+
+
+def commit(repo, files, message, remove=()):
+    for path, data in files.items():
+        target = repo / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(data)
+    for path in remove:
+        (repo / path).unlink()
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+
+
+@pytest.fixture(scope="module")
+def repo(tmp_path_factory):
+    """A repo whose older revisions live in a pack as deltas, with a loose commit on top."""
+    repo = tmp_path_factory.mktemp("repo")
+    git(repo, "init", "-q")
+    lines = [f"line {i}: {'x' * (i % 40)}\n".encode() for i in range(400)]
+    commit(repo, {"big.txt": b"".join(lines), "src/a.py": b"print('a')\n",
+                  "src/deep/b.go": b"package deep\n", "gone.txt": b"soon removed\n",
+                  "data.bin": bytes(range(256)) * 4}, "first")
+    git(repo, "tag", "-a", "v1", "-m", "first release")
+    lines[10] = b"changed in second\n"
+    commit(repo, {"big.txt": b"".join(lines), "src/a.py": b"print('a2')\n"}, "second",
+           remove=["gone.txt"])
+    lines[200:210] = [b"inserted\n"] * 3
+    commit(repo, {"big.txt": b"".join(lines), "src/new.md": b"# new\n"}, "third")
+    git(repo, "repack", "-a", "-d", "-f", "-q", "--depth=10", "--window=10")
+    commit(repo, {"src/a.py": b"print('loose')\n"}, "fourth")
+    return repo
+
+
+def archive(repo, rev):
+    """{path: bytes} of the files in rev, as git archive writes them."""
+    data = git(repo, "archive", "--format=tar", rev)
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        return {m.name: tar.extractfile(m).read() for m in tar.getmembers() if m.isfile()}
+
+
+def test_pack_holds_deltas(repo):
+    pack = next((repo / ".git" / "objects" / "pack").glob("*.idx"))
+    assert b"chain length" in git(repo, "verify-pack", "-v", str(pack))
+
+
+@pytest.mark.parametrize("rev", ["HEAD", "HEAD~1", "HEAD~2", "HEAD~3", "v1"])
+def test_rev_files_match_git_archive(repo, rev):
+    entries = rtt.iter_files(str(repo), ignore=False, rev=rev)
+    got = {os.path.relpath(e.path, str(repo)).replace(os.sep, "/"): e.loader() for e in entries}
+    assert got == archive(repo, rev)
+
+
+def test_rev_of_a_subdirectory(repo):
+    got = {os.path.relpath(e.path, str(repo / "src")).replace(os.sep, "/"): e.loader()
+           for e in rtt.iter_files(str(repo / "src"), ignore=False, rev="HEAD~2")}
+    assert got == archive(repo, "HEAD~2:src")
+
+
+@pytest.mark.parametrize("rev", ["HEAD", "HEAD~3"])
+def test_rev_output_matches_a_checkout(repo, tmp_path, rev):
+    checkout = tmp_path / repo.name
+    for path, data in archive(repo, rev).items():
+        (checkout / path).parent.mkdir(parents=True, exist_ok=True)
+        (checkout / path).write_bytes(data)
+    from_git = "".join(rtt.iter_chunks(str(repo), ignore=False, rev=rev))
+    from_checkout = "".join(rtt.iter_chunks(str(checkout), ignore=False))
+    assert from_git == from_checkout
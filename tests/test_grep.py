@@ -0,0 +1,26 @@
+import pytest
+
+import rtt
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    ("hello", "hello"),
+    (r"\x41BC", "BC"),
+    (r"A\x42C", "A"),
+    (r"\U00000041BC", "BC"),
+    (r"\N{LATIN SMALL LETTER A}BC", "BC"),
+    (r"\101BC", "BC"),
+    (r"(a)\1BC", "BC"),
+    (r"\0BC", "BC"),
+    (r"foo\.bar", "foo.bar"),
+    (r"ab\dcd", "ab"),
+])
+def test_required_literal_skips_escape_arguments(pattern, literal):
+    assert rtt._required_literal(pattern) == literal
+
+
+def test_grep_prefilter_keeps_escaped_matches(tmp_path):
+    path = tmp_path / "f.txt"
+    path.write_text("xxABCxx\n")
+    for pattern in (r"\x41BC", r"A\x42C", r"\101BC", r"\N{LATIN CAPITAL LETTER A}BC"):
+        assert rtt.Grep(pattern).filter([str(path)])